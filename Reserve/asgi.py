@@ -9,8 +9,12 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
+from .database import disable_persistent_connections
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Reserve.settings')
 
+disable_persistent_connections(settings.DATABASES)
 application = get_asgi_application()
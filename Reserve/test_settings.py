@@ -0,0 +1,17 @@
+"""
+Settings for the test suite and the benchmark command, which manage.py
+selects automatically. Only the knobs that make runs fast and quiet differ
+from production.
+"""
+from .settings import *  # noqa: F401,F403
+
+# PBKDF2 is deliberately slow; tests and benchmarks only need a working hash.
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Instrument every request, so tests can rely on the Server-Timing header.
+QUERY_INSTRUMENTATION = {**QUERY_INSTRUMENTATION, 'SAMPLE_RATE': 1.0}
+
+LOGGING = {
+    **LOGGING,
+    'loggers': {'core': {'handlers': ['json'], 'level': 'ERROR', 'propagate': False}},
+}
@@ -1,6 +1,11 @@
-from django.contrib import admin
+from collections import defaultdict
+
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from .models import Doctor, TimeSlot, Appointment, Review, CustomUser
+from .occupancy import set_appointments_status
+from .ratings import set_reviews_approval
+from .scheduling import slot_indexes
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -47,6 +52,29 @@ class TimeSlotAdmin(admin.ModelAdmin):
     list_filter = ['day_of_week', 'is_available', 'doctor__specialization']
     search_fields = ['doctor__user__first_name', 'doctor__user__last_name']
     list_editable = ['is_available', 'max_patients']
+    actions = ['report_overlaps']
+
+    def report_overlaps(self, request, queryset):
+        doctor_ids = queryset.values_list('doctor_id', flat=True).distinct()
+        slots = TimeSlot.objects.filter(doctor_id__in=doctor_ids, is_available=True).select_related('doctor__user')
+        by_doctor = defaultdict(list)
+        for slot in slots:
+            by_doctor[slot.doctor_id].append(slot)
+
+        overlaps = []
+        for doctor_slots in by_doctor.values():
+            for index in slot_indexes(doctor_slots).values():
+                for start, end, slot in index:
+                    overlaps.extend(
+                        f'{slot} / {other}' for _, _, other in index.overlapping(start, end)
+                        if (other.start_time, other.pk) > (slot.start_time, slot.pk)
+                    )
+        if overlaps:
+            self.message_user(request, 'بازه‌های متداخل: ' + '، '.join(overlaps), messages.WARNING)
+        else:
+            self.message_user(request, 'تداخلی پیدا نشد')
+
+    report_overlaps.short_description = 'بررسی تداخل بازه‌های پزشکان انتخاب شده'
 
 
 @admin.register(Appointment)
@@ -59,37 +87,31 @@ class AppointmentAdmin(admin.ModelAdmin):
     ]
     readonly_fields = ['created_at', 'updated_at']
     date_hierarchy = 'appointment_date'
-    actions = ['confirm_appointments', 'cancel_appointments', 'mark_completed']
+    actions = ['confirm_appointments', 'cancel_appointments', 'mark_completed', 'mark_no_show']
 
     def confirm_appointments(self, request, queryset):
-        updated = queryset.update(status='confirmed')
+        updated = set_appointments_status(queryset, 'confirmed')
         self.message_user(request, f'{updated} نوبت تایید شد')
 
     confirm_appointments.short_description = 'تایید نوبت‌های انتخاب شده'
 
     def cancel_appointments(self, request, queryset):
-        updated = queryset.update(status='cancelled')
+        updated = set_appointments_status(queryset, 'cancelled')
         self.message_user(request, f'{updated} نوبت لغو شد')
 
     cancel_appointments.short_description = 'لغو نوبت‌های انتخاب شده'
 
     def mark_completed(self, request, queryset):
-        updated = queryset.update(status='completed')
-        self.message_user(request, f'{updated} نوبت انجام شده标记 شد')
-
-    mark_completed.short_description = '标记 نوبت‌های انتخاب شده как انجام شده'
+        updated = set_appointments_status(queryset, 'completed')
+        self.message_user(request, f'{updated} نوبت انجام شده ثبت شد')
 
-    def confirm_appointments(self, request, queryset):
-        queryset.update(status='confirmed')
-        self.message_user(request, f"{queryset.count()} نوبت تایید شد")
+    mark_completed.short_description = 'ثبت نوبت‌های انتخاب شده به عنوان انجام شده'
 
-    confirm_appointments.short_description = "تایید نوبت‌های انتخاب شده"
-
-    def cancel_appointments(self, request, queryset):
-        queryset.update(status='cancelled')
-        self.message_user(request, f"{queryset.count()} نوبت لغو شد")
+    def mark_no_show(self, request, queryset):
+        updated = set_appointments_status(queryset, 'no_show')
+        self.message_user(request, f'{updated} نوبت به عنوان حاضر نشده ثبت شد')
 
-    cancel_appointments.short_description = "لغو نوبت‌های انتخاب شده"
+    mark_no_show.short_description = 'ثبت نوبت‌های انتخاب شده به عنوان حاضر نشده'
 
     def changelist_view(self, request, extra_context=None):
         today = timezone.now().date()
@@ -129,11 +151,11 @@ class ReviewAdmin(admin.ModelAdmin):
     has_appointment.boolean = True
 
     def approve_reviews(self, request, queryset):
-        updated = queryset.update(is_approved=True)
+        updated = set_reviews_approval(queryset, True)
         self.message_user(request, f'{updated} نظر تایید شد')
     approve_reviews.short_description = 'تایید نظرات انتخاب شده'
 
     def disapprove_reviews(self, request, queryset):
-        updated = queryset.update(is_approved=False)
+        updated = set_reviews_approval(queryset, False)
         self.message_user(request, f'{updated} نظر رد شد')
     disapprove_reviews.short_description = 'رد نظرات انتخاب شده'
\ No newline at end of file
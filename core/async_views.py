@@ -0,0 +1,201 @@
+"""
+Async versions of the public read endpoints, served under /api/async/ by the
+ASGI application (``Reserve.asgi``). They return the same payloads as the
+DRF views in ``core.views`` but use the async ORM, so a request waiting on
+the database does not hold a worker thread. The async ORM runs a request's
+queries one after another on a single thread, so they are awaited in turn.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .availability import adoctor_availability, parse_date_range, parse_time_window
+from .cache import api_cache, get_versions, record, response_key, scope_keys, versions_are_shared
+from .conditional import make_etag, stamp_validators
+from .models import Doctor, Review, TimeSlot
+from .pagination import ReviewPagination, StandardPagination, alist
+from .ratings import arating_stats
+from .serializers import DoctorWithRatingSerializer, ReviewSerializer, TimeSlotSerializer
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def api_view(view):
+    """
+    Hand the view a DRF ``Request`` and render ``APIException`` like DRF does.
+    Like ``APIView``, the view is exempt from the CSRF middleware.
+    """
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request, **kwargs):
+        request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            return await view(request, **kwargs)
+        except APIException as exc:
+            response = json_response({'detail': exc.detail}, exc.status_code)
+            if isinstance(exc, (AuthenticationFailed, NotAuthenticated)):
+                response['WWW-Authenticate'] = request.authenticators[0].authenticate_header(request)
+            return response
+    return wrapper
+
+
+def authenticated(view):
+    @wraps(view)
+    async def wrapper(request, **kwargs):
+        # Token authentication reads the token cache and database: do it off the event loop.
+        user = await sync_to_async(lambda: request.user)()
+        if not user.is_authenticated:
+            raise NotAuthenticated()
+        return await view(request, **kwargs)
+    return wrapper
+
+
+def lookup(request, scope, kwargs):
+    config = settings.API_CACHE
+    versions = get_versions(scope_keys(scope, kwargs))
+    key = response_key(request, versions)
+    data = api_cache().get(key) if config['ENABLED'] else None
+    if config['ENABLED']:
+        record('hit' if data is not None else 'miss')
+    return versions, key, data
+
+
+def cached(scope):
+    """
+    ``conditional(doctor_validators(scope))`` and ``cache_response(scope)``
+    for async views, with a single trip through the cache per request.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, **kwargs):
+            versions, key, data = await sync_to_async(lookup)(request, scope, kwargs)
+            if versions_are_shared():
+                etag, last_modified = make_etag(request, versions), max(versions) // 1_000_000
+            else:
+                etag, last_modified = await sync_to_async(stamp_validators)(request, scope, kwargs)
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None and data is not None:
+                response = json_response(data)
+            elif response is None:
+                data, status = await view(request, **kwargs)
+                response = json_response(data, status)
+                if status == 200 and settings.API_CACHE['ENABLED']:
+                    await api_cache().aset(key, data, settings.API_CACHE['TTL'])
+
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def doctors():
+    return Doctor.objects.select_related('user', 'rating_summary').order_by('id')
+
+
+async def get_doctor(pk):
+    try:
+        return await doctors().aget(pk=pk)
+    except Doctor.DoesNotExist:
+        raise NotFound('No Doctor matches the given query.')
+
+
+@require_safe
+@api_view
+@cached('doctors')
+async def doctor_list(request):
+    paginator = StandardPagination()
+    page = await paginator.apaginate_queryset(doctors(), request)
+    return paginator.get_paginated_response(DoctorWithRatingSerializer(page, many=True).data).data, 200
+
+
+@require_safe
+@api_view
+@cached('pk')
+async def doctor_detail(request, pk):
+    return DoctorWithRatingSerializer(await get_doctor(pk)).data, 200
+
+
+@require_safe
+@api_view
+@authenticated
+@cached('pk')
+async def doctor_time_slot(request, pk):
+    await get_doctor(pk)
+    slots = await alist(TimeSlot.objects.filter(doctor_id=pk, is_available=True))
+    return TimeSlotSerializer(slots, many=True).data, 200
+
+
+@require_safe
+@api_view
+async def doctor_availability(request, pk):
+    try:
+        date_from, date_to = parse_date_range(request.query_params)
+        time_from, time_to = parse_time_window(request.query_params)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    await get_doctor(pk)
+    slots = await adoctor_availability(pk, date_from, date_to, time_from, time_to)
+    return json_response({'doctor': pk, 'from': date_from, 'to': date_to, 'slots': slots})
+
+
+def doctor_summary(doctor):
+    return {
+        'id': doctor.id,
+        'name': doctor.user.get_full_name(),
+        'specialization': doctor.get_specialization_display(),
+    }
+
+
+async def get_doctor_summary(doctor_id):
+    try:
+        return doctor_summary(await Doctor.objects.select_related('user').aget(id=doctor_id))
+    except Doctor.DoesNotExist:
+        return None
+
+
+@require_safe
+@api_view
+@cached('doctor_id')
+async def doctor_reviews(request, doctor_id):
+    paginator = ReviewPagination()
+    reviews = Review.objects.filter(doctor_id=doctor_id, is_approved=True).select_related('patient', 'doctor__user')
+    # Decode the cursor first, so a bad one fails without touching the database.
+    page = paginator.page_queryset(reviews, request)
+    doctor = await get_doctor_summary(doctor_id)
+    if doctor is None:
+        return {'error': 'دکتر یافت نشد'}, 404
+    stats = await arating_stats(doctor_id)
+    page = paginator.set_page(await alist(page))
+    return {
+        'doctor': doctor,
+        'stats': stats,
+        'reviews': ReviewSerializer(page, many=True).data,
+        'next': paginator.get_next_link(),
+    }, 200
+
+
+@require_safe
+@api_view
+@cached('doctor_id')
+async def doctor_rating_stats(request, doctor_id):
+    doctor = await get_doctor_summary(doctor_id)
+    if doctor is None:
+        return {'error': 'دکتر یافت نشد'}, 404
+    return {'doctor': doctor, 'stats': await arating_stats(doctor_id)}, 200
@@ -0,0 +1,130 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import AuthToken
+
+
+class TokenCache:
+    """
+    Two-level token -> (user, token) cache.
+
+    Lookups hit an in-process LRU first and the shared Django cache second.
+    Invalidation clears both levels in this process and the shared level for
+    everyone; other processes drop their local copy only after LOCAL_TTL
+    seconds, so the local level is disabled (0) by default: logout and
+    deactivation must take effect immediately everywhere.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @property
+    def config(self):
+        return settings.AUTH_TOKEN_CACHE
+
+    def shared(self):
+        return caches[self.config['ALIAS']]
+
+    @staticmethod
+    def shared_key(key):
+        # Never put the raw credential into cache keys.
+        return 'auth:token:' + sha256(key.encode()).hexdigest()
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None:
+                expires, record = entry
+                if expires > now:
+                    self.local.move_to_end(key)
+                    self.counters['local_hits'] += 1
+                    return record
+                del self.local[key]
+
+        record = self.shared().get(self.shared_key(key))
+        if record is None:
+            self.count('misses')
+            return None
+        self.count('shared_hits')
+        self._store_local(key, record)
+        return record
+
+    def set(self, key, record):
+        self.shared().set(self.shared_key(key), record, self.config['SHARED_TTL'])
+        self._store_local(key, record)
+
+    def _store_local(self, key, record):
+        ttl = self.config['LOCAL_TTL']
+        if not ttl:
+            return
+        with self.lock:
+            self.local[key] = (time.monotonic() + ttl, record)
+            self.local.move_to_end(key)
+            while len(self.local) > self.config['LOCAL_MAX_ENTRIES']:
+                self.local.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.local.pop(key, None)
+            self.counters['invalidations'] += len(keys)
+        self.shared().delete_many([self.shared_key(key) for key in keys])
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters, local_entries=len(self.local))
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 3) if lookups else 0
+        stats['enabled'] = self.config['ENABLED']
+        return stats
+
+
+token_cache = TokenCache()
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        if not settings.AUTH_TOKEN_CACHE['ENABLED']:
+            return super().authenticate_credentials(key)
+
+        record = token_cache.get(key)
+        if record is None:
+            record = super().authenticate_credentials(key)
+            token_cache.set(key, record)
+        # Views may modify request.user, so never hand out the cached instance.
+        user, token = record
+        return copy.copy(user), copy.copy(token)
+
+
+class ExpiringTokenAuthentication(CachingTokenAuthentication):
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        user, token = super().authenticate_credentials(key)
+        now = timezone.now()
+        if token.is_expired(now):
+            token_cache.invalidate(key)
+            raise AuthenticationFailed('توکن منقضی شده است')
+        if token.touch(now) and settings.AUTH_TOKEN_CACHE['ENABLED']:
+            token_cache.set(key, (user, token))
+        return user, token
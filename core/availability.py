@@ -0,0 +1,192 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef, Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from .models import Appointment, Doctor, SlotOccupancy, TimeSlot
+from .pagination import alist
+from .scheduling import DAY_END, DAY_START, bookable_times, slot_indexes
+
+MAX_RANGE_DAYS = 60
+DEFAULT_RANGE_DAYS = 7
+SEARCH_MAX_RANGE_DAYS = 14
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+SEARCH_SLOTS_PER_DOCTOR = 3
+
+
+def day_of_week(date):
+    # TimeSlot.DAY_OF_WEEK starts the week on Saturday (0), date.weekday() on Monday (0).
+    return (date.weekday() + 2) % 7
+
+
+def parse_date_param(value, default):
+    if not value:
+        return default
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValueError('فرمت تاریخ باید YYYY-MM-DD باشد')
+    return date
+
+
+def parse_date_range(params, max_days=MAX_RANGE_DAYS):
+    today = timezone.now().date()
+    date_from = parse_date_param(params.get('from'), today)
+    date_to = parse_date_param(params.get('to'), date_from + timedelta(days=DEFAULT_RANGE_DAYS - 1))
+
+    date_from = max(date_from, today)
+    if date_to < date_from:
+        raise ValueError('تاریخ پایان باید بعد از تاریخ شروع باشد')
+    if (date_to - date_from).days >= max_days:
+        raise ValueError(f'بازه زمانی حداکثر می‌تواند {max_days} روز باشد')
+    return date_from, date_to
+
+
+def parse_time_window(params):
+    window = []
+    for name in ('time_from', 'time_to'):
+        value = params.get(name)
+        try:
+            parsed = parse_time(value) if value else None
+        except ValueError:
+            parsed = None
+        if value and parsed is None:
+            raise ValueError('فرمت ساعت باید HH:MM باشد')
+        window.append(parsed)
+    return window
+
+
+def booked_counts_query(date_from, date_to, **filters):
+    return SlotOccupancy.objects.filter(
+        appointment_date__range=(date_from, date_to),
+        booked__gt=0,
+        **filters
+    ).values_list('time_slot_id', 'appointment_date', 'booked')
+
+
+def booked_counts(date_from, date_to, **filters):
+    rows = booked_counts_query(date_from, date_to, **filters)
+    return {(time_slot_id, date): booked for time_slot_id, date, booked in rows}
+
+
+async def abooked_counts(date_from, date_to, **filters):
+    rows = booked_counts_query(date_from, date_to, **filters)
+    return {(time_slot_id, date): booked async for time_slot_id, date, booked in rows}
+
+
+def taken_times_query(date_from, date_to, **filters):
+    return Appointment.objects.filter(
+        appointment_date__range=(date_from, date_to),
+        status__in=Appointment.ACTIVE_STATUSES,
+        **filters
+    ).values_list('doctor_id', 'appointment_date', 'appointment_time').order_by()
+
+
+def taken_times(date_from, date_to, **filters):
+    taken = defaultdict(set)
+    for doctor_id, date, appointment_time in taken_times_query(date_from, date_to, **filters):
+        taken[doctor_id, date].add(appointment_time)
+    return taken
+
+
+async def ataken_times(date_from, date_to, **filters):
+    taken = defaultdict(set)
+    async for doctor_id, date, appointment_time in taken_times_query(date_from, date_to, **filters):
+        taken[doctor_id, date].add(appointment_time)
+    return taken
+
+
+def expand_slots(slots, date_from, date_to, booked, taken, time_from=None, time_to=None):
+    indexes = slot_indexes(slots)
+    by_day = {
+        day: [slot for _, _, slot in index.overlapping(time_from or DAY_START, time_to or DAY_END)]
+        for day, index in indexes.items()
+    }
+
+    date = date_from
+    while date <= date_to:
+        for slot in by_day.get(day_of_week(date), ()):
+            count = booked.get((slot.id, date), 0)
+            if count >= slot.max_patients:
+                continue
+            times = [
+                moment for moment in bookable_times(slot, date, taken.get((slot.doctor_id, date), ()))
+                if (not time_from or moment >= time_from) and (not time_to or moment < time_to)
+            ]
+            if times:
+                yield {
+                    'date': date,
+                    'time_slot': slot.id,
+                    'doctor': slot.doctor_id,
+                    'day_of_week': slot.day_of_week,
+                    'start_time': slot.start_time,
+                    'end_time': slot.end_time,
+                    'max_patients': slot.max_patients,
+                    'booked': count,
+                    'free': slot.max_patients - count,
+                    'times': times,
+                }
+        date += timedelta(days=1)
+
+
+def doctor_availability(doctor, date_from, date_to, time_from=None, time_to=None):
+    slots = available_slots(doctor)
+    booked = booked_counts(date_from, date_to, time_slot__doctor=doctor)
+    taken = taken_times(date_from, date_to, doctor=doctor)
+    return list(expand_slots(slots, date_from, date_to, booked, taken, time_from, time_to))
+
+
+async def adoctor_availability(doctor_id, date_from, date_to, time_from=None, time_to=None):
+    slots = await alist(available_slots(doctor_id))
+    booked = await abooked_counts(date_from, date_to, time_slot__doctor=doctor_id)
+    taken = await ataken_times(date_from, date_to, doctor=doctor_id)
+    return list(expand_slots(slots, date_from, date_to, booked, taken, time_from, time_to))
+
+
+def available_slots(doctor):
+    return TimeSlot.objects.filter(doctor=doctor, is_available=True).select_related('doctor')
+
+
+def search_availability(date_from, date_to, specialization=None, max_fee=None, time_from=None, time_to=None,
+                        after=None, limit=SEARCH_DEFAULT_LIMIT, slots_per_doctor=SEARCH_SLOTS_PER_DOCTOR):
+    days = {day_of_week(date_from + timedelta(days=i)) for i in range(min((date_to - date_from).days + 1, 7))}
+    slots = TimeSlot.objects.filter(day_of_week__in=days, is_available=True)
+    if time_from:
+        slots = slots.filter(end_time__gt=time_from)
+    if time_to:
+        slots = slots.filter(start_time__lt=time_to)
+
+    doctors = Doctor.objects.filter(Exists(slots.filter(doctor=OuterRef('pk'))))
+    if specialization:
+        doctors = doctors.filter(specialization=specialization)
+    if max_fee is not None:
+        doctors = doctors.filter(fee__lte=max_fee)
+    if after:
+        doctors = doctors.filter(pk__gt=after)
+    doctors = list(
+        doctors.select_related('user', 'rating_summary')
+        .prefetch_related(Prefetch('timeslot', queryset=slots, to_attr='matching_slots'))
+        .order_by('pk')[:limit]
+    )
+    if not doctors:
+        return [], None
+
+    booked = booked_counts(date_from, date_to, time_slot__doctor__in=doctors)
+    taken = taken_times(date_from, date_to, doctor__in=doctors)
+    results = []
+    for doctor in doctors:
+        free = []
+        for slot in expand_slots(doctor.matching_slots, date_from, date_to, booked, taken, time_from, time_to):
+            free.append(slot)
+            if len(free) == slots_per_doctor:
+                break
+        if free:
+            results.append((doctor, free))
+
+    next_cursor = doctors[-1].pk if len(doctors) == limit else None
+    return results, next_cursor
@@ -0,0 +1,169 @@
+import platform
+import random
+import time as clock
+from datetime import datetime, time, timedelta
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .cache import invalidate_all
+from .models import Appointment, AuthToken, CustomUser, Doctor, Review, TimeSlot
+from .occupancy import reconcile_occupancy
+from .ratings import rebuild_rating_summaries
+
+WORKING_DAYS = [0, 1, 2, 3, 4]
+SHIFTS = [(time(9), time(12)), (time(14), time(17))]
+PERCENTILES = [50, 90, 95, 99]
+
+
+class DatasetFactory:
+    """
+    Seed a reproducible synthetic dataset: doctors with a weekly schedule,
+    patients, appointments spread over the coming weeks and completed
+    appointments with reviews. Everything is inserted with ``bulk_create``
+    and the denormalized counters are rebuilt once at the end.
+    """
+
+    def __init__(self, doctors=50, patients=200, appointments=2000, reviews=1000, seed=0):
+        self.counts = {'doctors': doctors, 'patients': patients, 'appointments': appointments, 'reviews': reviews}
+        self.rng = random.Random(seed)
+        self.today = timezone.now().date()
+
+    def make_users(self, prefix, count, user_type):
+        password = make_password('benchmark')
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'{prefix}{i}', password=password, user_type=user_type,
+                       first_name=prefix.title(), last_name=str(i))
+            for i in range(count)
+        ], batch_size=500)
+        return list(CustomUser.objects.filter(user_type=user_type).order_by('id'))
+
+    def make_doctors(self):
+        specializations = [choice for choice, _ in Doctor.SPECIALIZATION_CHOICES]
+        Doctor.objects.bulk_create([
+            Doctor(user=user, specialization=self.rng.choice(specializations), phone='0912', address='Tehran',
+                   experience=self.rng.randint(1, 30), fee=self.rng.randrange(100, 1000, 50))
+            for user in self.make_users('doctor', self.counts['doctors'], 'doctor')
+        ], batch_size=500)
+        doctors = list(Doctor.objects.order_by('id'))
+        TimeSlot.objects.bulk_create([
+            TimeSlot(doctor=doctor, day_of_week=day, start_time=start, end_time=end, max_patients=6)
+            for doctor in doctors for day in WORKING_DAYS for start, end in SHIFTS
+        ], batch_size=1000)
+        return doctors
+
+    def slot_times(self, weeks):
+        """Every (doctor, slot, date, time) cell of the schedule in ``weeks``, in random order."""
+        slots = list(TimeSlot.objects.select_related('doctor'))
+        cells = []
+        for week in weeks:
+            for slot in slots:
+                day = self.today + timedelta(days=(slot.day_of_week - (self.today.weekday() + 2)) % 7, weeks=week)
+                cells.extend((slot, day, moment) for moment in slot.bookable_times(day, booked=()))
+        self.rng.shuffle(cells)
+        return cells
+
+    def make_appointments(self, patients, count, weeks, statuses):
+        cells = self.slot_times(weeks)[:count]
+        Appointment.objects.bulk_create([
+            Appointment(patient=self.rng.choice(patients), doctor=slot.doctor, time_slot=slot,
+                        appointment_date=day, appointment_time=moment, status=self.rng.choice(statuses))
+            for slot, day, moment in cells
+        ], batch_size=1000)
+
+    def seed(self):
+        doctors = self.make_doctors()
+        patients = self.make_users('patient', self.counts['patients'], 'patient')
+        self.make_appointments(patients, self.counts['appointments'], range(1, 9), Appointment.ACTIVE_STATUSES)
+        self.make_appointments(patients, self.counts['reviews'], range(-9, -1), ['completed'])
+        Review.objects.bulk_create([
+            Review(patient=appointment.patient, doctor=appointment.doctor, appointment=appointment,
+                   rating=self.rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 2, 4, 4])[0],
+                   is_approved=self.rng.random() < 0.9, comment='benchmark')
+            for appointment in Appointment.objects.filter(status='completed').select_related('patient', 'doctor')
+        ], batch_size=1000)
+
+        reconcile_occupancy(fix=True)
+        rebuild_rating_summaries()
+        invalidate_all()
+        return doctors, patients
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies, queries, statuses):
+    summary = {'requests': len(latencies), 'statuses': sorted(set(statuses))}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = round(percentile(latencies, p) * 1000, 3)
+    summary['mean_ms'] = round(sum(latencies) / len(latencies) * 1000, 3)
+    summary['max_ms'] = round(max(latencies) * 1000, 3)
+    summary['queries'] = {'min': min(queries), 'max': max(queries), 'mean': round(sum(queries) / len(queries), 2)}
+    return summary
+
+
+def measure(client, method, build, iterations, warmup=2, **headers):
+    """Call ``build(i)`` -> ``(url, data)`` and time ``iterations`` requests after ``warmup`` untimed ones."""
+    latencies, queries, statuses = [], [], []
+    for i in range(warmup + iterations):
+        url, data = build(i)
+        with CaptureQueriesContext(connection) as captured:
+            started = clock.perf_counter()
+            if method == 'post':
+                response = client.post(url, data, content_type='application/json', **headers)
+            else:
+                response = client.get(url, data, **headers)
+            elapsed = clock.perf_counter() - started
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries.append(len(captured))
+            statuses.append(response.status_code)
+    return summarize(latencies, queries, statuses)
+
+
+def run_benchmarks(factory, iterations=50):
+    doctors, patients = factory.seed()
+    rng = factory.rng
+    client = Client()
+    patient = patients[0]
+    auth = {'HTTP_AUTHORIZATION': f'Token {AuthToken.objects.issue(patient).key}'}
+    free = factory.slot_times(range(10, 20))
+
+    def pick_doctor(i):
+        return rng.choice(doctors).id
+
+    def book(i):
+        slot, day, moment = free[i]
+        return '/api/appointments/', {'doctor': slot.doctor_id, 'appointment_date': day.isoformat(),
+                                      'appointment_time': moment.strftime('%H:%M')}
+
+    cases = {
+        'doctor_list': ('get', lambda i: ('/api/doctors/', {}), {}),
+        'doctor_time_slot': ('get', lambda i: (f'/api/doctors/{pick_doctor(i)}/time_slot/', {}), auth),
+        'appointment_create': ('post', book, auth),
+        'appointment_list': ('get', lambda i: ('/api/appointments/', {}), auth),
+        'doctor_reviews': ('get', lambda i: (f'/api/doctors/{pick_doctor(i)}/reviews/', {}), {}),
+        'doctor_rating_stats': ('get', lambda i: (f'/api/doctors/{pick_doctor(i)}/rating-stats/', {}), {}),
+    }
+    results = {
+        name: measure(client, method, build, iterations, **headers)
+        for name, (method, build, headers) in cases.items()
+    }
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'dataset': factory.counts,
+        },
+        'results': results,
+    }
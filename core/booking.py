@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+
+from .availability import day_of_week
+from .models import Appointment, SlotOccupancy, TimeSlot
+from .scheduling import is_slot_start
+
+
+def find_time_slot(doctor, appointment_date, appointment_time):
+    slots = TimeSlot.objects.filter(
+        doctor=doctor,
+        day_of_week=day_of_week(appointment_date),
+        is_available=True,
+        start_time__lte=appointment_time,
+        end_time__gt=appointment_time,
+    ).select_related('doctor')
+    return slots.first()
+
+
+@contextmanager
+def write_transaction():
+    """
+    ``transaction.atomic()`` that starts with BEGIN IMMEDIATE on SQLite.
+
+    SQLite has no row locks: taking the database write lock before anything
+    is read makes concurrent bookings and appointment updates queue up on
+    busy_timeout, instead of failing to upgrade a read lock halfway through.
+    Other transactions keep the default DEFERRED mode, so read-only ones
+    never take the write lock.
+    Inside an existing transaction this is a plain savepoint.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    # Connecting resets transaction_mode from OPTIONS, so connect first.
+    connection.ensure_connection()
+    mode, connection.transaction_mode = connection.transaction_mode, 'IMMEDIATE'
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+def lock_occupancy(time_slot, appointment_date):
+    """
+    Lock the occupancy counter of ``time_slot`` on ``appointment_date``,
+    creating it if needed: bookings for the same slot and day queue up behind
+    each other, while other days and doctors are not blocked.
+    """
+    occupancy, _ = SlotOccupancy.objects.get_or_create(time_slot=time_slot, appointment_date=appointment_date)
+    if connection.features.has_select_for_update:
+        occupancy = SlotOccupancy.objects.select_for_update().get(pk=occupancy.pk)
+    return occupancy
+
+
+def book_appointment(patient, doctor, appointment_date, appointment_time, **extra):
+    try:
+        with write_transaction():
+            time_slot = find_time_slot(doctor, appointment_date, appointment_time)
+            if time_slot is None:
+                raise ValidationError('دکتر در این زمان بازه زمانی فعالی ندارد')
+            if not is_slot_start(time_slot, appointment_time):
+                raise ValidationError('زمان نوبت باید یکی از زمان‌های شروع نوبت در این بازه باشد')
+
+            if lock_occupancy(time_slot, appointment_date).booked >= time_slot.max_patients:
+                raise ValidationError('ظرفیت این بازه زمانی تکمیل شده است')
+
+            appointment = Appointment(
+                patient=patient,
+                doctor=doctor,
+                time_slot=time_slot,
+                appointment_date=appointment_date,
+                appointment_time=appointment_time,
+                **extra
+            )
+            # A time belongs to one slot, so the occupancy lock already queues
+            # bookings of it; the unique constraint rejects one that is taken.
+            appointment.save(force_insert=True, validate_constraints=False)
+            return appointment
+    except IntegrityError:
+        raise ValidationError('این زمان قبلاً رزرو شده است')
@@ -0,0 +1,139 @@
+import time
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import Doctor
+
+EPOCH_KEY = 'api:epoch'
+DOCTORS_KEY = 'api:doctors'
+STATS_KEYS = {'hit': 'api:stats:hits', 'miss': 'api:stats:misses'}
+# Backends whose contents other worker processes cannot see.
+LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def api_cache():
+    return caches[settings.API_CACHE['ALIAS']]
+
+
+def versions_are_shared():
+    return not isinstance(api_cache(), LOCAL_BACKENDS)
+
+
+def doctor_key(doctor_id):
+    return f'api:doctor:{doctor_id}'
+
+
+def _new_version():
+    # Versions are microsecond timestamps of the last change: an evicted key
+    # never comes back with a value it has already had, and the newest version
+    # doubles as the Last-Modified time of the responses built from it.
+    return time.time_ns() // 1000
+
+
+def get_versions(keys):
+    cache = api_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(key):
+    cache = api_cache()
+    cache.set(key, max((cache.get(key) or 0) + 1, _new_version()), None)
+
+
+def bump_versions(keys):
+    for key in keys:
+        bump_version(key)
+    # A request running between this bump and the commit could still cache
+    # the old rows under the new version, so bump again once they are visible.
+    transaction.on_commit(lambda: [bump_version(key) for key in keys])
+
+
+def invalidate_doctors(doctor_ids):
+    doctor_ids = set(doctor_ids)
+    # Conditional GETs are validated against Doctor.updated_at when the
+    # versions live in a per-process cache, see core.conditional.
+    Doctor.objects.filter(pk__in=doctor_ids).update(updated_at=timezone.now())
+    bump_versions([doctor_key(doctor_id) for doctor_id in doctor_ids] + [DOCTORS_KEY])
+
+
+def invalidate_all():
+    Doctor.objects.update(updated_at=timezone.now())
+    bump_versions([EPOCH_KEY])
+
+
+def record(event):
+    cache = api_cache()
+    key = STATS_KEYS[event]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def cache_stats():
+    counts = api_cache().get_many(STATS_KEYS.values())
+    hits = counts.get(STATS_KEYS['hit'], 0)
+    misses = counts.get(STATS_KEYS['miss'], 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else 0,
+    }
+
+
+def scope_keys(scope, kwargs):
+    if scope == 'doctors':
+        return [EPOCH_KEY, DOCTORS_KEY]
+    return [EPOCH_KEY, doctor_key(kwargs[scope])]
+
+
+def response_key(request, versions):
+    query = sorted(request.query_params.lists())
+    # Cached pages hold absolute next/previous links, so the host is part of the key.
+    raw = f'{request.scheme}://{request.get_host()}{request.path}?{query}:{versions}'
+    return 'api:response:' + md5(raw.encode()).hexdigest()
+
+
+def cache_response(scope):
+    """
+    Cache the successful GET responses of a view method.
+
+    ``scope`` is ``'doctors'`` for responses that depend on every doctor, or
+    the name of the URL kwarg that holds the doctor id. Writes invalidate by
+    bumping the matching version keys, see ``core.signals``.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            config = settings.API_CACHE
+            if not config['ENABLED'] or request.method != 'GET':
+                return method(view, request, *args, **kwargs)
+
+            cache = api_cache()
+            key = response_key(request, get_versions(scope_keys(scope, kwargs)))
+            data = cache.get(key)
+            if data is not None:
+                record('hit')
+                return Response(data)
+
+            record('miss')
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, config['TTL'])
+            return response
+        return wrapper
+    return decorator
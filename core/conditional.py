@@ -0,0 +1,83 @@
+from functools import wraps
+from hashlib import md5
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_versions, scope_keys, versions_are_shared
+from .models import Doctor
+
+
+def make_etag(request, *parts):
+    raw = f'{request.path}?{sorted(request.query_params.lists())}:{parts}'
+    return quote_etag(md5(raw.encode()).hexdigest())
+
+
+def doctor_validators(scope):
+    def validators(view, request, **kwargs):
+        if not versions_are_shared():
+            return stamp_validators(request, scope, kwargs)
+        versions = get_versions(scope_keys(scope, kwargs))
+        return make_etag(request, versions), max(versions) // 1_000_000
+    return validators
+
+
+def stamp_validators(request, scope, kwargs):
+    """
+    Validators from the newest ``updated_at`` and the count of the doctors in
+    ``scope``, which every invalidation touches. Used instead of versions kept
+    in a per-process cache, which would let other workers keep answering 304
+    after a change.
+    """
+    doctors = Doctor.objects.all() if scope == 'doctors' else Doctor.objects.filter(pk=kwargs[scope])
+    marker = doctors.order_by().aggregate(count=Count('id'), last=Max('updated_at'))
+    last = marker['last']
+    return make_etag(request, last, marker['count']), int(last.timestamp()) if last else None
+
+
+def queryset_validators(*related):
+    """
+    Validators from the newest ``updated_at`` and the row count of the view's
+    queryset, and the newest ``updated_at`` of the ``related`` rows that the
+    serializer nests (a renamed doctor changes the payload too).
+    """
+    def validators(view, request, **kwargs):
+        marker = view.get_queryset().order_by().aggregate(
+            count=Count('id'),
+            last=Max('updated_at'),
+            **{f'last_{i}': Max(f'{path}__updated_at') for i, path in enumerate(related)},
+        )
+        stamps = [value for key, value in marker.items() if key.startswith('last') and value is not None]
+        last = max(stamps) if stamps else None
+        last_modified = int(last.timestamp()) if last else None
+        return make_etag(request, request.user.pk, last, marker['count']), last_modified
+    return validators
+
+
+def conditional(validators):
+    """
+    Answer GET requests with 304 Not Modified when the client's ETag or
+    Last-Modified validators still match, without running the view.
+    ``validators(view, request, **kwargs)`` returns ``(etag, last_modified)``.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.method != 'GET':
+                return method(view, request, *args, **kwargs)
+
+            etag, last_modified = validators(view, request, **kwargs)
+            if etag is None:
+                return method(view, request, *args, **kwargs)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
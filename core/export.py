@@ -0,0 +1,121 @@
+"""
+Stream appointments as CSV or JSON Lines. Rows are read with
+``QuerySet.iterator(chunk_size=...)`` over a ``values_list`` projection, so
+memory stays flat however many rows match (PostgreSQL uses a server-side
+cursor; SQLite fetches ``chunk_size`` rows at a time).
+"""
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .availability import parse_date_param
+from .models import Appointment
+
+CHUNK_SIZE = 2000
+
+# (column, lookup). Free-text medical fields (symptoms, notes, prescription) are left out.
+COLUMNS = [
+    ('id', 'id'),
+    ('appointment_date', 'appointment_date'),
+    ('appointment_time', 'appointment_time'),
+    ('status', 'status'),
+    ('is_urgent', 'is_urgent'),
+    ('doctor_id', 'doctor_id'),
+    ('doctor_first_name', 'doctor__user__first_name'),
+    ('doctor_last_name', 'doctor__user__last_name'),
+    ('specialization', 'doctor__specialization'),
+    ('patient_id', 'patient_id'),
+    ('patient_first_name', 'patient__first_name'),
+    ('patient_last_name', 'patient__last_name'),
+    ('created_at', 'created_at'),
+]
+HEADER = [column for column, _ in COLUMNS]
+
+# Spreadsheets evaluate cells starting with these as formulas.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def parse_filters(params):
+    """
+    ``from``/``to`` (inclusive dates), ``doctor`` (id) and ``status`` (repeated
+    or comma separated) from query parameters or command options.
+    """
+    filters = {}
+    date_from = parse_date_param(params.get('from'), None)
+    date_to = parse_date_param(params.get('to'), None)
+    if date_from and date_to and date_to < date_from:
+        raise ValueError('تاریخ پایان باید بعد از تاریخ شروع باشد')
+    if date_from:
+        filters['appointment_date__gte'] = date_from
+    if date_to:
+        filters['appointment_date__lte'] = date_to
+
+    doctor = params.get('doctor')
+    if doctor is not None and doctor != '':
+        try:
+            filters['doctor_id'] = int(doctor)
+        except (TypeError, ValueError):
+            raise ValueError('شناسه دکتر نامعتبر است')
+
+    values = params.getlist('status') if hasattr(params, 'getlist') else params.get('status') or []
+    statuses = {status.strip() for value in values for status in value.split(',') if status.strip()}
+    if statuses - {choice for choice, _ in Appointment.STATUS_CHOICES}:
+        raise ValueError('وضعیت نامعتبر است')
+    if statuses:
+        filters['status__in'] = sorted(statuses)
+    return filters
+
+
+def export_rows(filters, chunk_size=CHUNK_SIZE):
+    # Primary key order lets the database stream rows instead of sorting them all first.
+    queryset = Appointment.objects.filter(**filters).order_by('pk').values_list(*[lookup for _, lookup in COLUMNS])
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+async def aexport_lines(write_lines, filters, chunk_size=CHUNK_SIZE):
+    """
+    ``write_lines(export_rows(filters))`` as an async iterator, for responses
+    served under ASGI, which would otherwise read a sync iterator to the end
+    before sending anything. Each chunk is read and formatted in a worker
+    thread. ``values_list(...).aiterator()`` is not used: in Django 5.2 it
+    runs the query on the event loop.
+    """
+    lines = write_lines(export_rows(filters, chunk_size))
+    next_chunk = sync_to_async(lambda: list(islice(lines, chunk_size)))
+    while chunk := await next_chunk():
+        for line in chunk:
+            yield line
+
+
+class Echo:
+    """File-like object whose ``write`` returns the line, for ``csv.writer``."""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+def jsonl_lines(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(HEADER, row))) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+    'jsonl': (jsonl_lines, 'application/x-ndjson; charset=utf-8'),
+}
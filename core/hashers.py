@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2 hasher with the work factor taken from
+    ``settings.PASSWORD_PBKDF2_ITERATIONS`` when it is set, and Django's own
+    default otherwise. Existing hashes keep verifying
+    with their own iteration count and are upgraded on the next login.
+    """
+    iterations = getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,109 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from .middleware import sql_signature
+from .models import AuthToken
+
+SCANS = {
+    # CONSTANT ROW is the FROM-less SELECT of a conditional constraint check.
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)(\w+)( USING (?:COVERING )?INDEX)?'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)()'),
+}
+
+# Tables a hot query may legitimately read from end to end: the doctor
+# directory is listed and searched in primary key order, a page at a time.
+ALLOWED_SCANS = {'core_doctor'}
+
+
+class SelectRecorder:
+    """``execute_wrapper`` that keeps the SELECT statements (with parameters) a view runs."""
+
+    def __init__(self):
+        self.queries = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.queries.setdefault(sql_signature(sql), (sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        # An empty test table is always cheapest to read sequentially, so ask
+        # PostgreSQL whether it *could* use an index instead.
+        cursor.execute('SET enable_seqscan = off')
+        try:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.execute('RESET enable_seqscan')
+
+
+def full_scans(sql, plan, allowed=ALLOWED_SCANS):
+    """
+    Tables ``plan`` reads from end to end. Walking an index in ``ORDER BY``
+    order under a ``LIMIT`` is fine: it stops after one page.
+    """
+    paged = ' LIMIT ' in sql and not any('TEMP B-TREE' in line and 'ORDER BY' in line for line in plan)
+    scans = set()
+    for line in plan:
+        for table, index in SCANS[connection.vendor].findall(line):
+            if table not in allowed and not (index and paged):
+                scans.add(table)
+    return sorted(scans)
+
+
+def hot_requests(doctor, patient, day):
+    """``(name, method, url, data, user)`` for the endpoints the API serves most."""
+    return [
+        ('doctor_list', 'get', '/api/doctors/', {}, None),
+        ('doctor_detail', 'get', f'/api/doctors/{doctor.id}/', {}, None),
+        ('doctor_time_slot', 'get', f'/api/doctors/{doctor.id}/time_slot/', {}, patient),
+        ('doctor_availability', 'get', f'/api/doctors/{doctor.id}/availability/', {}, None),
+        ('doctor_search', 'get', '/api/doctors/search/', {'specialization': doctor.specialization}, None),
+        ('doctor_reviews', 'get', f'/api/doctors/{doctor.id}/reviews/', {}, None),
+        ('doctor_rating_stats', 'get', f'/api/doctors/{doctor.id}/rating-stats/', {}, None),
+        ('appointment_list_patient', 'get', '/api/appointments/', {}, patient),
+        ('appointment_list_doctor', 'get', '/api/appointments/', {}, doctor.user),
+        ('appointment_create', 'post', '/api/appointments/', {
+            'doctor': doctor.id, 'appointment_date': day.isoformat(), 'appointment_time': '09:00',
+        }, patient),
+    ]
+
+
+def audit_views(doctor, patient, day):
+    """
+    Call each hot endpoint, EXPLAIN every distinct SELECT it ran and report
+    the tables the database would read with a full scan.
+    """
+    client = Client()
+    results = []
+    with override_settings(API_CACHE={**settings.API_CACHE, 'ENABLED': False}):
+        for name, method, url, data, user in hot_requests(doctor, patient, day):
+            headers = {}
+            if user is not None:
+                headers['HTTP_AUTHORIZATION'] = f'Token {AuthToken.objects.issue(user).key}'
+            recorder = SelectRecorder()
+            with connection.execute_wrapper(recorder):
+                if method == 'post':
+                    response = client.post(url, data, content_type='application/json', **headers)
+                else:
+                    response = client.get(url, data, **headers)
+            for sql, params in recorder.queries.values():
+                plan = explain(sql, params)
+                results.append({
+                    'view': name,
+                    'status': response.status_code,
+                    'sql': sql,
+                    'plan': plan,
+                    'full_scans': full_scans(sql, plan),
+                })
+    return results
+
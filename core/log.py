@@ -0,0 +1,167 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+request_id = ContextVar('request_id', default=None)
+
+SENSITIVE_FIELDS = re.compile(r'pass|token|secret|key|authorization|national_code|cookie', re.I)
+REDACTED = '***'
+REQUEST_ID_HEADER = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else was passed through ``extra``.
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+logger = logging.getLogger('core.requests')
+
+
+def redact(value):
+    if isinstance(value, dict) or hasattr(value, 'items'):
+        return {
+            key: REDACTED if SENSITIVE_FIELDS.search(str(key)) else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(redact(entry), ensure_ascii=False, default=str)
+
+
+class QueuedJsonHandler(QueueHandler):
+    """
+    Hand records to a background thread that formats them as JSON and writes
+    them to ``stream``, so request threads never block on log I/O.
+
+    Python 3.11's dictConfig cannot build the QueueListener, so the handler
+    owns it and starts it on first use (and again in forked workers).
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        target = logging.StreamHandler(stream or sys.stderr)
+        target.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, target, respect_handler_level=False)
+        self.lock_listener = threading.Lock()
+        self.listener_pid = None
+
+    def start_listener(self):
+        with self.lock_listener:
+            if self.listener_pid == os.getpid():
+                return
+            # A forked child inherits the stopped thread's state, not the thread.
+            self.listener._thread = None
+            self.listener.start()
+            self.listener_pid = os.getpid()
+            atexit.register(self.stop_listener)
+
+    def stop_listener(self):
+        with self.lock_listener:
+            if self.listener_pid == os.getpid():
+                self.listener.stop()
+                self.listener_pid = None
+
+    def prepare(self, record):
+        # Render everything that depends on the request thread (arguments,
+        # traceback, correlation id) before the record leaves it, but keep the
+        # ``extra`` fields for the JSON formatter.
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = getattr(record, 'request_id', None) or request_id.get()
+        return record
+
+    def enqueue(self, record):
+        if self.listener_pid != os.getpid():
+            self.start_listener()
+        super().enqueue(record)
+
+
+class RequestIdMiddleware:
+    """
+    Give every request a correlation id (an incoming ``X-Request-ID`` or a new
+    one), attach it to log records and echo it in the response, and log one
+    line per request to the views listed in ``REQUEST_LOGGING['VIEW_MODULES']``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token, started = self.start(request)
+        try:
+            return self.finish(request, self.get_response(request), started)
+        finally:
+            request_id.reset(token)
+
+    async def __acall__(self, request):
+        token, started = self.start(request)
+        try:
+            return self.finish(request, await self.get_response(request), started)
+        finally:
+            request_id.reset(token)
+
+    @staticmethod
+    def start(request):
+        incoming = request.headers.get('X-Request-ID', '')
+        current = incoming if REQUEST_ID_HEADER.match(incoming) else uuid.uuid4().hex
+        return request_id.set(current), time.perf_counter()
+
+    def finish(self, request, response, started):
+        response['X-Request-ID'] = request_id.get()
+        if self.should_log(request):
+            logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'user_id': getattr(getattr(request, 'user', None), 'pk', None),
+            })
+        return response
+
+    @staticmethod
+    def should_log(request):
+        config = settings.REQUEST_LOGGING
+        match = getattr(request, 'resolver_match', None)
+        if not config['ENABLED'] or match is None:
+            return False
+        view = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None) or match.func
+        return view.__module__ in config['VIEW_MODULES']
@@ -0,0 +1,51 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.availability import day_of_week
+from core.benchmark import WORKING_DAYS, DatasetFactory
+from core.index_audit import audit_views
+
+
+class Command(BaseCommand):
+    help = ('Seed a small dataset into a throwaway test database, call the hot API endpoints and EXPLAIN '
+            'every query they run. Fails if any of them needs a full table scan.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plan of every query.')
+        parser.add_argument('--json', action='store_true', dest='as_json', help='Print the full report as JSON.')
+
+    def handle(self, *args, verbose_plans, as_json, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            factory = DatasetFactory(doctors=5, patients=10, appointments=50, reviews=20)
+            doctors, patients = factory.seed()
+            day = factory.today + timedelta(weeks=10)
+            while day_of_week(day) not in WORKING_DAYS:
+                day += timedelta(days=1)
+            results = audit_views(doctors[0], patients[0], day)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if as_json:
+            self.stdout.write(json.dumps(results, indent=2, default=str))
+        else:
+            for result in results:
+                failed = bool(result['full_scans'])
+                if failed or verbose_plans:
+                    style = self.style.ERROR if failed else self.style.SUCCESS
+                    self.stdout.write(style(f'{result["view"]}: {result["sql"]}'))
+                    for line in result['plan']:
+                        self.stdout.write(f'    {line}')
+
+        failures = [result for result in results if result['full_scans']]
+        if failures:
+            tables = sorted({table for result in failures for table in result['full_scans']})
+            raise CommandError(f'{len(failures)} of {len(results)} queries scan whole tables: {", ".join(tables)}')
+        if not as_json:
+            self.stdout.write(self.style.SUCCESS(f'{len(results)} queries checked, no full table scans'))
@@ -0,0 +1,188 @@
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from core.benchmark import PERCENTILES, DatasetFactory, percentile
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    help = ('Compare the sync DRF read endpoints under WSGI with a fixed pool of worker threads against the '
+            'async endpoints under ASGI, with many clients in flight and an emulated database round trip. '
+            'Runs in a throwaway test database and prints throughput and latency percentiles as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=600)
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight at once.')
+        parser.add_argument('--workers', type=int, default=4, help='WSGI worker threads.')
+        parser.add_argument('--db-latency', type=float, default=2.0,
+                            help='Milliseconds added to every query, like a network round trip to the database.')
+        parser.add_argument('--doctors', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(API_CACHE={**settings.API_CACHE, 'ENABLED': False}), \
+                    db_latency(options['db_latency'] / 1000):
+                report = self.run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def run(self, options):
+        factory = DatasetFactory(doctors=options['doctors'], patients=20, appointments=200, reviews=100,
+                                 seed=options['seed'])
+        doctors, patients = factory.seed()
+        token = AuthToken.objects.issue(patients[0]).key
+        rng = random.Random(options['seed'])
+        paths = [
+            'doctors/',
+            'doctors/{id}/',
+            'doctors/{id}/time_slot/',
+            'doctors/{id}/availability/',
+            'doctors/{id}/reviews/',
+            'doctors/{id}/rating-stats/',
+        ]
+        requests = [
+            paths[i % len(paths)].format(id=rng.choice(doctors).id)
+            for i in range(options['requests'])
+        ]
+        headers = {'authorization': f'Token {token}'}
+
+        return {
+            'meta': {
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'wsgi_workers': options['workers'],
+                'db_latency_ms': options['db_latency'],
+                'database': connection.vendor,
+            },
+            'wsgi': run_wsgi([f'/api/{path}' for path in requests], headers,
+                             options['concurrency'], options['workers']),
+            'asgi': asyncio.run(run_asgi([f'/api/async/{path}' for path in requests], headers,
+                                         options['concurrency'])),
+        }
+
+
+@contextmanager
+def db_latency(seconds):
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    # Every thread has its own connections, so hook each one as it is opened.
+    # Connections open lazily inside ``execute_wrapper`` blocks (see
+    # QueryInstrumentationMiddleware), which pop the last wrapper on exit, so
+    # this one goes first.
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.insert(0, delay)
+
+    connection_created.connect(install)
+    for conn in connections.all():
+        conn.execute_wrappers.append(delay)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+
+
+def report(latencies, statuses, elapsed):
+    result = {'requests_per_second': round(len(latencies) / elapsed, 1), 'seconds': round(elapsed, 3)}
+    for p in PERCENTILES:
+        result[f'p{p}_ms'] = round(percentile(latencies, p) * 1000, 2)
+    result['statuses'] = sorted(set(statuses))
+    return result
+
+
+def run_wsgi(paths, headers, concurrency, workers):
+    """``concurrency`` clients queue up for ``workers`` threads, like a threaded WSGI server."""
+    application = get_wsgi_application()
+    environ_headers = {f'HTTP_{name.upper()}': value for name, value in headers.items()}
+
+    def call(path):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'HTTP_HOST': 'testserver',
+            'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+            **environ_headers,
+        }
+        statuses = []
+        body = application(environ, lambda status, response_headers: statuses.append(int(status[:3])))
+        b''.join(body)
+        body.close()
+        return statuses[0]
+
+    with ThreadPoolExecutor(workers) as server, ThreadPoolExecutor(concurrency) as clients:
+        def request(path):
+            started = time.perf_counter()
+            status = server.submit(call, path).result()
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        results = list(clients.map(request, paths))
+        elapsed = time.perf_counter() - started
+    return report([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+async def run_asgi(paths, headers, concurrency):
+    """``concurrency`` clients talk to the ASGI application on one event loop, like an ASGI server."""
+    application = get_asgi_application()
+    limit = asyncio.Semaphore(concurrency)
+    raw_headers = [(b'host', b'testserver')] + [(name.encode(), value.encode()) for name, value in headers.items()]
+
+    async def call(path):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': raw_headers, 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        statuses = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Nothing more to read; a server would wait here for a disconnect.
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        async with limit:
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - started, statuses[0]
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(call(path) for path in paths))
+    elapsed = time.perf_counter() - started
+    return report([latency for latency, _ in results], [status for _, status in results], elapsed)
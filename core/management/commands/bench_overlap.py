@@ -0,0 +1,61 @@
+import random
+import timeit
+from datetime import time
+
+from django.core.management.base import BaseCommand
+
+from core.scheduling import IntervalIndex
+
+
+def loop_conflict(intervals, start, end):
+    # The scan TimeSlot.clean used to do, one slot at a time.
+    for interval in intervals:
+        if start < interval[1] and end > interval[0]:
+            return interval
+    return None
+
+
+def make_intervals(count):
+    # ``count`` back-to-back intervals across the day, down to one-second slots.
+    span = 24 * 3600 // count
+    intervals = []
+    for i in range(count):
+        start, end = i * span, (i + 1) * span - 1
+        intervals.append((time(start // 3600, start // 60 % 60, start % 60),
+                          time(end // 3600, end // 60 % 60, end % 60), i))
+    return intervals
+
+
+class Command(BaseCommand):
+    help = ('Compare IntervalIndex overlap lookups with the linear scan for 10, 100 and 1000 slots: per lookup '
+            'against an index built in advance (bulk paths), and for a single check that has to build the '
+            'index first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--queries', type=int, default=1000, help='Lookups per measurement.')
+
+    def handle(self, *args, sizes, queries, **options):
+        rng = random.Random(0)
+        self.stdout.write(f'{"slots":>6} {"loop µs":>10} {"index µs":>10} {"build µs":>10} '
+                          f'{"lookup x":>9} {"build+1 x":>10}')
+        for count in sizes:
+            intervals = make_intervals(count)
+            probes = [(item[0], item[1]) for item in rng.choices(intervals, k=queries)]
+            index = IntervalIndex(intervals)
+            for start, end in probes:
+                assert (loop_conflict(intervals, start, end) is None) == (index.conflict(start, end) is None)
+
+            loop = min(timeit.repeat(
+                lambda: [loop_conflict(intervals, start, end) for start, end in probes], number=1, repeat=5
+            )) / queries
+            indexed = min(timeit.repeat(
+                lambda: [index.conflict(start, end) for start, end in probes], number=1, repeat=5
+            )) / queries
+            build = min(timeit.repeat(lambda: IntervalIndex(intervals), number=1, repeat=5))
+            # "build+1" is one validation that builds an index for a single
+            # lookup; below 1x the linear scan is the better choice.
+            self.stdout.write(
+                f'{count:>6} {loop * 1e6:>10.2f} {indexed * 1e6:>10.2f} {build * 1e6:>10.1f} '
+                f'{loop / indexed:>8.1f}x {loop / (build + indexed):>9.2f}x'
+            )
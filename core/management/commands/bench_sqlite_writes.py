@@ -0,0 +1,142 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import Counter
+from datetime import time as clock_time, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+
+from core.availability import day_of_week, doctor_availability
+from core.benchmark import SHIFTS, WORKING_DAYS, DatasetFactory
+from core.booking import book_appointment
+from core.models import CustomUser, TimeSlot
+
+# SQLite as Django configures it out of the box: rollback journal, full sync
+# and the sqlite3 module's 5 second busy handler. Both profiles book through
+# core.booking.write_transaction (BEGIN IMMEDIATE).
+PROFILES = {
+    'baseline': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'tuned': None,
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure concurrent booking throughput, with availability readers running alongside, on a '
+            'temporary SQLite file with the default configuration and with the tuned pragmas from settings.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Processes booking appointments.')
+        parser.add_argument('--bookings', type=int, default=25, choices=range(1, 48), metavar='1-47',
+                            help='Bookings attempted per writer (half-hour steps within one day).')
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Processes reading availability while the writers book.')
+        parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+        parser.add_argument('--directory', help='Where to put the database files (defaults to a temp dir); '
+                                                'use a real disk to include fsync cost.')
+
+    def handle(self, *args, writers, bookings, readers, profiles, directory=None, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write('This benchmark only applies to SQLite')
+            return
+
+        base = settings.DATABASES['default']
+        report = {'writers': writers, 'bookings_per_writer': bookings, 'readers': readers, 'profiles': {}}
+        with tempfile.TemporaryDirectory(dir=directory) as directory:
+            try:
+                self.run_profiles(directory, base, profiles, writers, bookings, readers, report)
+            finally:
+                connections.close_all()
+                connections.settings['default'] = base
+                del connections['default']
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run_profiles(self, directory, base, profiles, writers, bookings, readers, report):
+        for name in profiles:
+            database = {**base, 'NAME': os.path.join(directory, f'{name}.sqlite3'), 'CONN_MAX_AGE': 0}
+            pragmas = settings.SQLITE_PRAGMAS if PROFILES[name] is None else PROFILES[name]
+            with override_settings(SQLITE_PRAGMAS=pragmas):
+                report['profiles'][name] = self.run_profile(database, writers, bookings, readers)
+
+    def run_profile(self, database, writers, bookings, readers):
+        connections['default'].close()
+        connections.settings['default'] = database
+        del connections['default']
+        call_command('migrate', verbosity=0)
+
+        factory = DatasetFactory(doctors=writers, patients=1, appointments=0, reviews=0)
+        doctors, patients = factory.seed()
+        # One all-day slot per working day, so every writer has room for all its bookings.
+        TimeSlot.objects.exclude(start_time=SHIFTS[0][0]).delete()
+        TimeSlot.objects.update(start_time=clock_time(0), end_time=clock_time(23, 59), max_patients=10 ** 6)
+        patient = CustomUser.objects.get(pk=patients[0].pk)
+        day = factory.today + timedelta(days=1)
+        while day_of_week(day) not in WORKING_DAYS:
+            day += timedelta(days=1)
+        connections['default'].close()
+
+        # Separate processes, like separate server workers: threads would
+        # mostly measure the GIL rather than SQLite's locking.
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        barrier = context.Barrier(writers + readers + 1)
+        writing = context.Event()
+        writing.set()
+
+        def run(job, index):
+            counters = Counter()
+            barrier.wait()
+            try:
+                job(index, counters)
+            finally:
+                connections.close_all()
+                results.put(dict(counters))
+
+        def write(index, counters):
+            # Every writer books for its own doctor, so all conflicts are lock contention.
+            for i in range(bookings):
+                try:
+                    book_appointment(patient, doctors[index], day, clock_time(i * 30 // 60, i * 30 % 60))
+                    counters['booked'] += 1
+                except OperationalError:
+                    counters['lock_errors'] += 1
+                except ValidationError:
+                    counters['rejected'] += 1
+
+        def read(index, counters):
+            while writing.is_set():
+                try:
+                    doctor_availability(doctors[index % len(doctors)], day, day + timedelta(days=6))
+                    counters['reads'] += 1
+                except OperationalError:
+                    counters['read_lock_errors'] += 1
+
+        processes = [context.Process(target=run, args=(write, i)) for i in range(writers)]
+        background = [context.Process(target=run, args=(read, i)) for i in range(readers)]
+        for process in processes + background:
+            process.start()
+        barrier.wait()
+        started = time.perf_counter()
+        counters = Counter({'booked': 0, 'rejected': 0, 'lock_errors': 0, 'reads': 0, 'read_lock_errors': 0})
+        for _ in processes:
+            counters.update(results.get())
+        elapsed = time.perf_counter() - started
+        writing.clear()
+        for _ in background:
+            counters.update(results.get())
+        for process in processes + background:
+            process.join()
+
+        return {
+            **counters,
+            'seconds': round(elapsed, 3),
+            'bookings_per_second': round(counters['booked'] / elapsed, 1),
+            'reads_per_second': round(counters['reads'] / elapsed, 1),
+            'pragmas': dict(settings.SQLITE_PRAGMAS),
+        }
@@ -0,0 +1,47 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from core.benchmark import DatasetFactory, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Seed a synthetic dataset into a throwaway test database and time the hot API endpoints, '
+            'printing latency percentiles and query counts as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--patients', type=int, default=200)
+        parser.add_argument('--appointments', type=int, default=2000)
+        parser.add_argument('--reviews', type=int, default=1000)
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per endpoint.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-cache', action='store_true', help='Disable the API response cache.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        factory = DatasetFactory(doctors=options['doctors'], patients=options['patients'],
+                                 appointments=options['appointments'], reviews=options['reviews'],
+                                 seed=options['seed'])
+        api_cache = {**settings.API_CACHE, 'ENABLED': settings.API_CACHE['ENABLED'] and not options['no_cache']}
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(API_CACHE=api_cache):
+                report = run_benchmarks(factory, iterations=options['iterations'])
+            report['meta']['api_cache'] = api_cache['ENABLED']
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Benchmark report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
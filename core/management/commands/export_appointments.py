@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import CHUNK_SIZE, FORMATS, export_rows, parse_filters
+
+
+class Command(BaseCommand):
+    help = ('Stream appointments as CSV or JSON Lines, optionally filtered by date range, doctor and status, '
+            'reading the database in chunks so memory stays flat.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from', help='First appointment date (YYYY-MM-DD).')
+        parser.add_argument('--to', help='Last appointment date (YYYY-MM-DD).')
+        parser.add_argument('--doctor', type=int)
+        parser.add_argument('--status', action='append', default=[],
+                            help='Only these statuses (may be repeated or comma separated).')
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output', help='Write to this file instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, format, output, chunk_size, **options):
+        try:
+            filters = parse_filters(options)
+        except ValueError as e:
+            raise CommandError(e)
+
+        write_lines, _ = FORMATS[format]
+        lines = write_lines(export_rows(filters, chunk_size))
+        if not output:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        written = 0
+        with open(output, 'w', newline='', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line)
+                written += 1
+        rows = written - 1 if format == 'csv' else written
+        self.stdout.write(self.style.SUCCESS(f'{rows} appointments exported to {output}'))
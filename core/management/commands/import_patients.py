@@ -0,0 +1,71 @@
+import csv
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.models import CustomUser
+
+FIELDS = ['username', 'email', 'first_name', 'last_name', 'phone', 'national_code', 'date_of_birth', 'password']
+
+
+class Command(BaseCommand):
+    help = ('Import patients from a CSV file with a header row (username is required; email, first_name, '
+            'last_name, phone, national_code, date_of_birth and password are optional) using batched bulk_create.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without writing anything.')
+
+    def handle(self, *args, path, batch_size, dry_run, **options):
+        created = skipped = 0
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            if 'username' not in (reader.fieldnames or []):
+                raise CommandError('CSV must have a username column')
+            rows = (row for row in reader)
+            while batch := list(islice(rows, batch_size)):
+                users, batch_skipped = self.build_batch(batch, start=created + skipped)
+                skipped += batch_skipped
+                if not dry_run:
+                    CustomUser.objects.bulk_create(users, batch_size=batch_size)
+                created += len(users)
+
+        verb = 'would be imported' if dry_run else 'imported'
+        self.stdout.write(self.style.SUCCESS(f'{created} patients {verb}, {skipped} rows skipped'))
+
+    def build_batch(self, rows, start):
+        usernames = {row['username'].strip() for row in rows}
+        existing = set(CustomUser.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+        users, skipped = [], 0
+        for line, row in enumerate(rows, start=start + 2):
+            data = {field: (row.get(field) or '').strip() for field in FIELDS}
+            if not data['username'] or data['username'] in existing:
+                self.stderr.write(f'line {line}: username "{data["username"]}" is missing or already taken')
+                skipped += 1
+                continue
+            try:
+                date_of_birth = parse_date(data['date_of_birth']) if data['date_of_birth'] else None
+            except ValueError:
+                date_of_birth = None
+            if data['date_of_birth'] and date_of_birth is None:
+                self.stderr.write(f'line {line}: invalid date_of_birth "{data["date_of_birth"]}"')
+                skipped += 1
+                continue
+            existing.add(data['username'])
+            users.append(CustomUser(
+                username=data['username'],
+                email=data['email'],
+                first_name=data['first_name'],
+                last_name=data['last_name'],
+                phone=data['phone'],
+                national_code=data['national_code'],
+                date_of_birth=date_of_birth,
+                # Hashing is the expensive part; rows without a password get an unusable one.
+                password=make_password(data['password'] or None),
+                user_type='patient',
+            ))
+        return users, skipped
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    help = 'Delete expired auth tokens in small chunks so the table is never locked for long.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between chunks to leave room for other writers.')
+
+    def handle(self, *args, chunk_size, pause, **options):
+        now = timezone.now()
+        purged = 0
+        while True:
+            keys = list(AuthToken.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:chunk_size])
+            if not keys:
+                break
+            purged += AuthToken.objects.filter(pk__in=keys).delete()[0]
+            if pause:
+                time.sleep(pause)
+        self.stdout.write(self.style.SUCCESS(f'{purged} expired tokens purged'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.cache import invalidate_all
+from core.ratings import rebuild_rating_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-doctor rating summaries from the approved reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, action='append', dest='doctor_ids',
+                            help='Only rebuild these doctor ids (may be repeated).')
+
+    def handle(self, *args, doctor_ids=None, **options):
+        with transaction.atomic():
+            rebuilt = rebuild_rating_summaries(doctor_ids)
+            invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'{rebuilt} rating summaries rebuilt'))
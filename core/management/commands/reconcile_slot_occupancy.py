@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.occupancy import reconcile_occupancy
+
+
+class Command(BaseCommand):
+    help = 'Compare the slot occupancy counters with the appointment table and repair any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift, do not repair it.')
+
+    def handle(self, *args, dry_run=False, **options):
+        drift = reconcile_occupancy(fix=not dry_run)
+        for (time_slot_id, appointment_date), stored, expected in drift:
+            self.stdout.write(f'time_slot={time_slot_id} date={appointment_date}: stored={stored} expected={expected}')
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Slot occupancy is consistent'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} drifted counters found'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(drift)} drifted counters repaired'))
@@ -0,0 +1,120 @@
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('core.queries')
+
+IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+
+def sql_signature(sql):
+    # Parameters are already separate from the SQL; only IN lists vary in shape.
+    return IN_LIST.sub('(%s, ...)', sql)
+
+
+class QueryStats:
+    """``execute_wrapper`` that counts queries, DB time and repeated statements."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.signatures[sql_signature(sql)] += 1
+
+    def duplicates(self, threshold):
+        return [(sql, count) for sql, count in self.signatures.most_common() if count >= threshold]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Count the queries and DB time of a sample of requests without relying on
+    DEBUG, report them in a ``Server-Timing`` header and log slow requests and
+    repeated statements (usually an N+1) to the ``core.queries`` logger.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = settings.QUERY_INSTRUMENTATION
+        if not self.sampled(config):
+            return self.get_response(request)
+
+        stats = QueryStats()
+        started = time.perf_counter()
+        with self.instrument(stats):
+            response = self.get_response(request)
+        return self.report(request, response, stats, time.perf_counter() - started, config)
+
+    async def __acall__(self, request):
+        config = settings.QUERY_INSTRUMENTATION
+        if not self.sampled(config):
+            return await self.get_response(request)
+
+        stats = QueryStats()
+        started = time.perf_counter()
+        # Connections are per thread and async views run their queries in the
+        # request's sync thread, so the wrappers are installed there.
+        stack = await sync_to_async(self.instrument)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.report(request, response, stats, time.perf_counter() - started, config)
+
+    @staticmethod
+    def sampled(config):
+        return config['ENABLED'] and random.random() < config['SAMPLE_RATE']
+
+    @staticmethod
+    def instrument(stats):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        return stack
+
+    def report(self, request, response, stats, total, config):
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = (
+                f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", app;dur={total * 1000:.2f}'
+            )
+
+        duplicates = stats.duplicates(config['DUPLICATE_THRESHOLD'])
+        slow = total * 1000 >= config['SLOW_MS'] or stats.count >= config['SLOW_QUERIES']
+        if slow or duplicates:
+            logger.warning(
+                '%s %s: %d queries, %.1f ms in db, %.1f ms total',
+                request.method, request.path, stats.count, stats.duration * 1000, total * 1000,
+                extra={'query_stats': {
+                    'method': request.method,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'queries': stats.count,
+                    'db_ms': round(stats.duration * 1000, 2),
+                    'total_ms': round(total * 1000, 2),
+                    'duplicates': [{'sql': sql[:500], 'count': count} for sql, count in duplicates],
+                }},
+            )
+        return response
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def build_summaries(apps, schema_editor):
+    Doctor = apps.get_model('core', 'Doctor')
+    DoctorRatingSummary = apps.get_model('core', 'DoctorRatingSummary')
+    Review = apps.get_model('core', 'Review')
+
+    stars = ['one_star', 'two_star', 'three_star', 'four_star', 'five_star']
+    aggregates = {'total_reviews': Count('id'), 'rating_sum': Sum('rating', default=0)}
+    for rating, field in enumerate(stars, start=1):
+        aggregates[field] = Count('id', filter=Q(rating=rating))
+
+    rows = {
+        row.pop('doctor_id'): row
+        for row in Review.objects.filter(is_approved=True).values('doctor_id').annotate(**aggregates).order_by()
+    }
+    DoctorRatingSummary.objects.bulk_create(
+        [DoctorRatingSummary(doctor_id=doctor_id, **rows.get(doctor_id, {}))
+         for doctor_id in Doctor.objects.values_list('id', flat=True)],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_appointment_doctor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorRatingSummary',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='core.doctor', verbose_name='دکتر')),
+                ('total_reviews', models.PositiveIntegerField(default=0, verbose_name='تعداد نظرات')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='مجموع امتیازها')),
+                ('one_star', models.PositiveIntegerField(default=0, verbose_name='۱ ستاره')),
+                ('two_star', models.PositiveIntegerField(default=0, verbose_name='۲ ستاره')),
+                ('three_star', models.PositiveIntegerField(default=0, verbose_name='۳ ستاره')),
+                ('four_star', models.PositiveIntegerField(default=0, verbose_name='۴ ستاره')),
+                ('five_star', models.PositiveIntegerField(default=0, verbose_name='۵ ستاره')),
+            ],
+            options={
+                'verbose_name': 'خلاصه امتیاز دکتر',
+                'verbose_name_plural': 'خلاصه امتیاز دکترها',
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_occupancy(apps, schema_editor):
+    Appointment = apps.get_model('core', 'Appointment')
+    SlotOccupancy = apps.get_model('core', 'SlotOccupancy')
+
+    rows = Appointment.objects.filter(status__in=['pending', 'confirmed']).values(
+        'time_slot_id', 'appointment_date'
+    ).annotate(booked=Count('id')).order_by()
+    SlotOccupancy.objects.bulk_create([SlotOccupancy(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_doctorratingsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_date', models.DateField(verbose_name='تاریخ نوبت')),
+                ('booked', models.PositiveIntegerField(default=0, verbose_name='تعداد رزرو فعال')),
+            ],
+            options={
+                'verbose_name': 'ظرفیت رزرو شده',
+                'verbose_name_plural': 'ظرفیت\u200cهای رزرو شده',
+            },
+        ),
+        migrations.AddField(
+            model_name='slotoccupancy',
+            name='time_slot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='core.timeslot', verbose_name='بازه زمانی'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='slotoccupancy',
+            unique_together={('time_slot', 'appointment_date')},
+        ),
+        migrations.RunPython(build_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:41
+
+from datetime import timedelta
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# The AUTH_TOKEN_EXPIRY['TTL'] default when this migration was written, fixed
+# here so that the migration does not change with the settings.
+LEGACY_TOKEN_TTL = timedelta(days=7)
+
+
+def copy_legacy_tokens(apps, schema_editor):
+    # Existing rest_framework.authtoken tokens keep working and start their
+    # expiry window from the moment of the migration.
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('core', 'AuthToken')
+
+    now = timezone.now()
+    expires_at = now + LEGACY_TOKEN_TTL
+    AuthToken.objects.bulk_create(
+        [AuthToken(key=token.key, user_id=token.user_id, last_used=now, expires_at=expires_at)
+         for token in Token.objects.all()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0004_alter_tokenproxy_options'),
+        ('core', '0007_slotoccupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False, verbose_name='کلید')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')),
+                ('last_used', models.DateTimeField(default=django.utils.timezone.now, verbose_name='آخرین استفاده')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='تاریخ انقضا')),
+            ],
+            options={
+                'verbose_name': 'توکن',
+                'verbose_name_plural': 'توکن\u200cها',
+            },
+        ),
+        migrations.AddField(
+            model_name='authtoken',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.RunPython(copy_legacy_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_authtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='appointment_minutes',
+            field=models.PositiveSmallIntegerField(default=30, verbose_name='مدت هر نوبت (دقیقه)'),
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='appointment_minutes',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='اگر خالی باشد مدت پیش‌فرض دکتر استفاده می‌شود', null=True, verbose_name='مدت هر نوبت (دقیقه)'),
+        ),
+    ]
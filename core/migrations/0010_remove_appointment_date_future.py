@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:55
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_appointment_minutes'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='appointment',
+            name='appointment_date_future',
+        ),
+    ]
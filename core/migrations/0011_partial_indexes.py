@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:08
+
+from django.db import migrations, models
+
+from core.migration_ops import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_remove_appointment_date_future'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'confirmed'])), fields=['doctor', 'appointment_date'], name='appointment_active_doctor_date'),
+        ),
+        AddIndexConcurrently(
+            model_name='review',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['doctor', '-created_at'], name='review_approved_doctor'),
+        ),
+    ]
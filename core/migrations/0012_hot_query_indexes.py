@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:11
+
+from django.db import migrations, models
+
+from core.migration_ops import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_partial_indexes'),
+    ]
+
+    # New indexes are built before the ones they replace are dropped.
+    operations = [
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'appointment_date', 'status', 'appointment_time'], name='appointment_doctor_date_cover'),
+        ),
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['time_slot', 'appointment_date', 'status'], name='appointment_slot_date'),
+        ),
+        AddIndexConcurrently(
+            model_name='review',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['-created_at', '-id'], name='review_approved_recent'),
+        ),
+        AddIndexConcurrently(
+            model_name='review',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['doctor', '-created_at', '-id'], name='review_approved_doctor_recent'),
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='core_appoin_doctor__c8a408_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_approved_doctor',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:40
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def fix_short_appointments(apps, schema_editor):
+    # Rows saved before the validator existed: back to the field defaults.
+    apps.get_model('core', 'Doctor').objects.filter(appointment_minutes__lt=5).update(appointment_minutes=30)
+    apps.get_model('core', 'TimeSlot').objects.filter(appointment_minutes__lt=5).update(appointment_minutes=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_user_doctor_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctor',
+            name='appointment_minutes',
+            field=models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(5)], verbose_name='مدت هر نوبت (دقیقه)'),
+        ),
+        migrations.AlterField(
+            model_name='timeslot',
+            name='appointment_minutes',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='اگر خالی باشد مدت پیش\u200cفرض دکتر استفاده می\u200cشود', null=True, validators=[django.core.validators.MinValueValidator(5)], verbose_name='مدت هر نوبت (دقیقه)'),
+        ),
+        migrations.RunPython(fix_short_appointments, migrations.RunPython.noop),
+    ]
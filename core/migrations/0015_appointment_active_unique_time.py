@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_appointment_minutes_min'),
+    ]
+
+    # The partial constraint is added before the full one is dropped, so the
+    # table is never left without a uniqueness check.
+    operations = [
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'confirmed'])), fields=('doctor', 'appointment_date', 'appointment_time'), name='appointment_active_doctor_time', violation_error_message='این زمان قبلاً رزرو شده است'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='appointment',
+            unique_together=set(),
+        ),
+    ]
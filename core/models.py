@@ -1,9 +1,14 @@
+import binascii
+import os
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.core.validators import MinValueValidator
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
-from django.db.models import Avg
+
+MIN_APPOINTMENT_MINUTES = 5
 
 
 class CustomUser(AbstractUser):
@@ -19,6 +24,7 @@ class CustomUser(AbstractUser):
     user_type = models.CharField(max_length=10, choices=USER_TYPE_CHOICES, default='patient', verbose_name='نوع کاربر')
     is_verified = models.BooleanField(default=False, verbose_name='تایید شده')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')
 
     class Meta:
         verbose_name = 'کاربر'
@@ -27,6 +33,27 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f'{self.get_full_name()} - {self.get_user_type_display()}'
 
+    # Copied into cached authentication records and API responses, see core.signals.
+    CACHED_FIELDS = ('first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser', 'user_type')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_cached_fields()
+        return instance
+
+    def remember_cached_fields(self):
+        self._loaded_values = {field: self.__dict__[field] for field in self.CACHED_FIELDS if field in self.__dict__}
+
+    def changed_cached_fields(self):
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return set(self.CACHED_FIELDS)
+        return {
+            field for field in self.CACHED_FIELDS
+            if field in self.__dict__ and (field not in loaded or self.__dict__[field] != loaded[field])
+        }
+
     @property
     def is_patient(self):
         return self.user_type == 'patient'
@@ -36,6 +63,56 @@ class CustomUser(AbstractUser):
         return self.user_type == 'doctor'
 
 
+class AuthTokenManager(models.Manager):
+    def issue(self, user):
+        now = timezone.now()
+        token = self.filter(user=user, expires_at__gt=now).order_by('-expires_at').first()
+        if token:
+            token.touch(now)
+            return token
+        return self.create(user=user, last_used=now, expires_at=now + AuthToken.lifetime())
+
+
+class AuthToken(models.Model):
+    key = models.CharField(max_length=40, primary_key=True, verbose_name='کلید')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='auth_tokens', verbose_name='کاربر')
+    created = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+    last_used = models.DateTimeField(default=timezone.now, verbose_name='آخرین استفاده')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='تاریخ انقضا')
+
+    objects = AuthTokenManager()
+
+    class Meta:
+        verbose_name = 'توکن'
+        verbose_name_plural = 'توکن‌ها'
+
+    def __str__(self):
+        return f'{self.user} - {self.expires_at:%Y-%m-%d %H:%M}'
+
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = binascii.hexlify(os.urandom(20)).decode()
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def lifetime():
+        return timedelta(seconds=settings.AUTH_TOKEN_EXPIRY['TTL'])
+
+    def is_expired(self, now=None):
+        return self.expires_at <= (now or timezone.now())
+
+    def touch(self, now=None):
+        # Sliding expiry, written at most once per TOUCH_INTERVAL so that
+        # authenticated reads do not all turn into writes.
+        now = now or timezone.now()
+        if (now - self.last_used).total_seconds() < settings.AUTH_TOKEN_EXPIRY['TOUCH_INTERVAL']:
+            return False
+        self.last_used = now
+        self.expires_at = now + self.lifetime()
+        AuthToken.objects.filter(pk=self.pk).update(last_used=self.last_used, expires_at=self.expires_at)
+        return True
+
+
 class Doctor(models.Model):
     SPECIALIZATION_CHOICES = [
         ('cardiologist', 'قلب و عروق'),
@@ -52,6 +129,9 @@ class Doctor(models.Model):
     address = models.TextField()
     experience = models.IntegerField(help_text='سال های تجربه')
     fee = models.DecimalField(max_digits=10, decimal_places=2)
+    appointment_minutes = models.PositiveSmallIntegerField(default=30, validators=[MinValueValidator(MIN_APPOINTMENT_MINUTES)],
+                                                           verbose_name='مدت هر نوبت (دقیقه)')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')
 
     class Meta:
         verbose_name = 'دکتر'
@@ -59,14 +139,13 @@ class Doctor(models.Model):
 
     @property
     def average_rating(self):
-        reviews = Review.objects.filter(doctor=self, is_approved=True)
-        if reviews.exists():
-            return round(reviews.aggregate(Avg('rating'))['rating__avg'], 1)
-        return 0
+        summary = getattr(self, 'rating_summary', None)
+        return summary.average_rating if summary else 0
 
     @property
     def total_reviews(self):
-        return Review.objects.filter(doctor=self, is_approved=True).count()
+        summary = getattr(self, 'rating_summary', None)
+        return summary.total_reviews if summary else 0
 
     def __str__(self):
         return f'Dr. {self.user.first_name} {self.user.last_name}'
@@ -83,6 +162,9 @@ class TimeSlot(models.Model):
     end_time = models.TimeField(verbose_name='ساعت پایان')
     is_available = models.BooleanField(default=True, verbose_name='فعال')
     max_patients = models.PositiveIntegerField(default=1, verbose_name='حداکثر بیماران',help_text='حداکثر تعداد بیمار در این بازه زمانی')
+    appointment_minutes = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='مدت هر نوبت (دقیقه)',
+                                                           validators=[MinValueValidator(MIN_APPOINTMENT_MINUTES)],
+                                                           help_text='اگر خالی باشد مدت پیش‌فرض دکتر استفاده می‌شود')
 
     class Meta:
         verbose_name = 'بازه زمانی'
@@ -100,27 +182,39 @@ class TimeSlot(models.Model):
     def clean(self):
         if self.start_time >= self.end_time:
             raise ValidationError('ساعت شروع باید قبل از ساعت پایان باشد')
-        overlapping_slots = TimeSlot.objects.filter(doctor=self.doctor, day_of_week=self.day_of_week, is_available=True).exclude(pk=self.pk)
+        # One question about one slot: let the database answer it. Bulk paths
+        # that check many slots at once use scheduling.IntervalIndex instead.
+        conflict = TimeSlot.objects.filter(
+            doctor=self.doctor,
+            day_of_week=self.day_of_week,
+            is_available=True,
+            start_time__lt=self.end_time,
+            end_time__gt=self.start_time,
+        ).exclude(pk=self.pk).select_related('doctor__user').order_by('start_time').first()
+        if conflict:
+            raise ValidationError(f'این بازه زمانی با بازه {conflict} تداخل دارد')
+
+    @property
+    def duration(self):
+        start = datetime.combine(timezone.now().date(), self.start_time)
+        end = datetime.combine(timezone.now().date(), self.end_time)
+        return end - start
 
-        for slot in overlapping_slots:
-            if (self.start_time < slot.end_time and self.end_time > slot.start_time):
-                raise ValidationError(f'این بازه زمانی با بازه {slot} تداخل دارد')
+    @property
+    def is_active(self):
+        return self.is_available and self.doctor.user.is_active
 
-        @property
-        def duration(self):
-            from datetime import datetime, timedelta
-            start = datetime.combine(timezone.now().date(), self.start_time)
-            end = datetime.combine(timezone.now().date(), self.end_time)
-            return end - start
+    def get_appointment_minutes(self):
+        return self.appointment_minutes or self.doctor.appointment_minutes
 
-        @property
-        def is_active(self):
-            return self.is_available and self.doctor.user.is_active
+    def bookable_times(self, date, booked=None):
+        from .scheduling import bookable_times
 
-        def get_available_slots(self, date):
-            from .models import Appointment
-            appointments_count = Appointment.objects.filter(time_slot=self, appointment_date=date, status__in=['pending', 'confirmed']).count()
-            return self.max_patients - appointments_count
+        return bookable_times(self, date, booked)
+
+    def get_available_slots(self, date):
+        booked = SlotOccupancy.objects.filter(time_slot=self, appointment_date=date).values_list('booked', flat=True)
+        return self.max_patients - (booked.first() or 0)
 
 
 class Appointment(models.Model):
@@ -131,6 +225,7 @@ class Appointment(models.Model):
         ('completed', 'تمام شده'),
         ('no_show', 'حاضر نشده'),
     ]
+    ACTIVE_STATUSES = ['pending', 'confirmed']
 
     patient = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='appointments', verbose_name='بیمار',
                                 limit_choices_to={'user_type': 'patient'})
@@ -150,21 +245,42 @@ class Appointment(models.Model):
     class Meta:
         verbose_name = 'نوبت'
         verbose_name_plural = 'نوبت‌ها'
-        unique_together = ['doctor', 'appointment_date', 'appointment_time']
         ordering = ['-appointment_date', 'appointment_time']
+        constraints = [
+            # Cancelled and finished appointments free their time for a new booking.
+            models.UniqueConstraint(fields=['doctor', 'appointment_date', 'appointment_time'],
+                                    condition=models.Q(status__in=['pending', 'confirmed']),
+                                    name='appointment_active_doctor_time',
+                                    violation_error_message='این زمان قبلاً رزرو شده است'),
+        ]
         indexes = [
             models.Index(fields=['patient', 'appointment_date']),
-            models.Index(fields=['doctor', 'appointment_date', 'status']),
             models.Index(fields=['appointment_date', 'status']),
+            # Booking conflicts and availability only ever look at active appointments.
+            # PostgreSQL matches this predicate (psycopg binds parameters client-side);
+            # SQLite cannot, as the IN list arrives as bound parameters, and uses the
+            # covering index below for the taken-times lookups instead.
+            models.Index(fields=['doctor', 'appointment_date'], condition=models.Q(status__in=['pending', 'confirmed']),
+                         name='appointment_active_doctor_date'),
+            models.Index(fields=['doctor', 'appointment_date', 'status', 'appointment_time'],
+                         name='appointment_doctor_date_cover'),
+            models.Index(fields=['time_slot', 'appointment_date', 'status'], name='appointment_slot_date'),
         ]
-        constraints = [
-            models.CheckConstraint(check=models.Q(appointment_date__gte=timezone.now().date()), name='appointment_date_future')]
 
     def __str__(self):
         return f"{self.patient.get_full_name()} - {self.doctor.user.get_full_name()} - {self.appointment_date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_date = instance.__dict__.get('appointment_date')
+        return instance
+
     def clean(self):
-        if self.appointment_date < timezone.now().date():
+        # Only new or moved appointments must be in the future; past rows stay
+        # editable (completing, cancelling, notes).
+        date_changed = self._state.adding or self.appointment_date != getattr(self, '_loaded_date', None)
+        if date_changed and self.appointment_date < timezone.now().date():
             raise ValidationError('تاریخ نوبت نمی‌تواند در گذشته باشد')
 
         if self.time_slot.doctor != self.doctor:
@@ -173,19 +289,25 @@ class Appointment(models.Model):
         if not self.time_slot.is_available:
             raise ValidationError('این بازه زمانی در دسترس نیست')
 
-        conflicting_appointments = Appointment.objects.filter(
-            doctor=self.doctor,
-            appointment_date=self.appointment_date,
-            appointment_time=self.appointment_time,
-            status__in=['pending', 'confirmed']
-        ).exclude(pk=self.pk)
-
-        if conflicting_appointments.exists():
-            raise ValidationError('این زمان قبلاً رزرو شده است')
-
-    def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
+    def save(self, *args, validate_constraints=True, **kwargs):
+        """
+        ``validate_constraints=False`` leaves a taken time to the database
+        constraint, for callers that already serialise bookings of the slot.
+        """
+        from .booking import write_transaction
+        from .occupancy import appointment_changed
+
+        self.full_clean(validate_constraints=validate_constraints)
+        with write_transaction():
+            previous = None
+            if self.pk:
+                # Locked, so concurrent transitions of this appointment move the counter once.
+                previous = Appointment.objects.select_for_update().filter(pk=self.pk).values(
+                    'time_slot_id', 'appointment_date', 'status'
+                ).first()
+            super().save(*args, **kwargs)
+            appointment_changed(previous, self)
+        self._loaded_date = self.appointment_date
 
     @property
     def is_upcoming(self):
@@ -205,7 +327,7 @@ class Appointment(models.Model):
 
     @property
     def duration_minutes(self):
-        return 30
+        return self.time_slot.get_appointment_minutes()
 
     def get_appointment_datetime(self):
         return datetime.combine(self.appointment_date, self.appointment_time)
@@ -231,6 +353,25 @@ class Appointment(models.Model):
                 self.notes = notes
             self.save()
 
+    def mark_no_show(self):
+        if self.status == 'confirmed':
+            self.status = 'no_show'
+            self.save()
+
+
+class SlotOccupancy(models.Model):
+    time_slot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE, related_name='occupancy', verbose_name='بازه زمانی')
+    appointment_date = models.DateField(verbose_name='تاریخ نوبت')
+    booked = models.PositiveIntegerField(default=0, verbose_name='تعداد رزرو فعال')
+
+    class Meta:
+        verbose_name = 'ظرفیت رزرو شده'
+        verbose_name_plural = 'ظرفیت‌های رزرو شده'
+        unique_together = ['time_slot', 'appointment_date']
+
+    def __str__(self):
+        return f'{self.time_slot} - {self.appointment_date}: {self.booked}'
+
 
 class Review(models.Model):
     RATING_CHOICES = [
@@ -251,6 +392,13 @@ class Review(models.Model):
 
     class Meta:
         unique_together = ['patient', 'doctor', 'appointment']
+        indexes = [
+            # Match the (-created_at, -id) keyset ordering of the public review lists.
+            models.Index(fields=['doctor', '-created_at', '-id'], condition=models.Q(is_approved=True),
+                         name='review_approved_doctor_recent'),
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_approved=True),
+                         name='review_approved_recent'),
+        ]
         verbose_name = 'نظر و امتیاز'
         verbose_name_plural = 'نظرات و امتیازها'
 
@@ -269,5 +417,40 @@ class Review(models.Model):
                 raise ValidationError('شما فقط می‌توانید برای دکترهایی که نوبت داشته‌اید نظر دهید')
 
     def save(self, *args, **kwargs):
+        from .ratings import review_changed
+
         self.full_clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                # Locked, so a concurrent save of this review cannot apply the same delta again.
+                previous = Review.objects.select_for_update().filter(pk=self.pk).values(
+                    'doctor_id', 'rating', 'is_approved'
+                ).first()
+            super().save(*args, **kwargs)
+            review_changed(previous, self)
+
+
+class DoctorRatingSummary(models.Model):
+    doctor = models.OneToOneField(Doctor, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary',
+                                  verbose_name='دکتر')
+    total_reviews = models.PositiveIntegerField(default=0, verbose_name='تعداد نظرات')
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name='مجموع امتیازها')
+    one_star = models.PositiveIntegerField(default=0, verbose_name='۱ ستاره')
+    two_star = models.PositiveIntegerField(default=0, verbose_name='۲ ستاره')
+    three_star = models.PositiveIntegerField(default=0, verbose_name='۳ ستاره')
+    four_star = models.PositiveIntegerField(default=0, verbose_name='۴ ستاره')
+    five_star = models.PositiveIntegerField(default=0, verbose_name='۵ ستاره')
+
+    class Meta:
+        verbose_name = 'خلاصه امتیاز دکتر'
+        verbose_name_plural = 'خلاصه امتیاز دکترها'
+
+    def __str__(self):
+        return f'{self.doctor} - {self.average_rating} ({self.total_reviews})'
+
+    @property
+    def average_rating(self):
+        if not self.total_reviews:
+            return 0
+        return round(self.rating_sum / self.total_reviews, 1)
@@ -0,0 +1,96 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Appointment, SlotOccupancy
+
+
+def active_counts(appointments=None):
+    appointments = Appointment.objects.all() if appointments is None else appointments
+    rows = appointments.filter(status__in=Appointment.ACTIVE_STATUSES).values(
+        'time_slot_id', 'appointment_date'
+    ).annotate(booked=Count('id')).order_by()
+    return {(row['time_slot_id'], row['appointment_date']): row['booked'] for row in rows}
+
+
+def rebuild_occupancy(time_slot_id, appointment_date):
+    booked = active_counts(Appointment.objects.filter(time_slot_id=time_slot_id, appointment_date=appointment_date))
+    SlotOccupancy.objects.update_or_create(
+        time_slot_id=time_slot_id,
+        appointment_date=appointment_date,
+        defaults={'booked': booked.get((time_slot_id, appointment_date), 0)},
+    )
+
+
+def apply_occupancy_delta(time_slot_id, appointment_date, count):
+    updated = SlotOccupancy.objects.filter(time_slot_id=time_slot_id, appointment_date=appointment_date).update(
+        booked=F('booked') + count
+    )
+    # As with the rating summaries, a missing row is rebuilt from the
+    # appointment table, which already contains this change.
+    if not updated and count > 0:
+        rebuild_occupancy(time_slot_id, appointment_date)
+
+
+def appointment_changed(previous, appointment):
+    was_active = bool(previous and previous['status'] in Appointment.ACTIVE_STATUSES)
+    is_active = appointment.status in Appointment.ACTIVE_STATUSES
+    old_key = (previous['time_slot_id'], previous['appointment_date']) if previous else None
+    new_key = (appointment.time_slot_id, appointment.appointment_date)
+    if was_active and is_active and old_key == new_key:
+        return
+    if was_active:
+        apply_occupancy_delta(*old_key, -1)
+    if is_active:
+        apply_occupancy_delta(*new_key, 1)
+
+
+def set_appointments_status(queryset, status):
+    becomes_active = status in Appointment.ACTIVE_STATUSES
+    with transaction.atomic():
+        changed = list(
+            queryset.exclude(status=status).select_for_update().values_list(
+                'pk', 'time_slot_id', 'appointment_date', 'status'
+            )
+        )
+        if not changed:
+            return 0
+        Appointment.objects.filter(pk__in=[row[0] for row in changed]).update(status=status, updated_at=timezone.now())
+
+        deltas = Counter()
+        for _, time_slot_id, appointment_date, old_status in changed:
+            was_active = old_status in Appointment.ACTIVE_STATUSES
+            if was_active != becomes_active:
+                deltas[time_slot_id, appointment_date] += 1 if becomes_active else -1
+        for (time_slot_id, appointment_date), count in deltas.items():
+            apply_occupancy_delta(time_slot_id, appointment_date, count)
+    return len(changed)
+
+
+def reconcile_occupancy(fix=True):
+    expected = active_counts()
+    stored = {
+        (row.time_slot_id, row.appointment_date): row
+        for row in SlotOccupancy.objects.all().iterator(chunk_size=2000)
+    }
+
+    drift = []
+    for key in expected.keys() | stored.keys():
+        booked = expected.get(key, 0)
+        row = stored.get(key)
+        if (row.booked if row else 0) != booked:
+            drift.append((key, row.booked if row else None, booked))
+
+    if fix and drift:
+        with transaction.atomic():
+            SlotOccupancy.objects.bulk_create(
+                [SlotOccupancy(time_slot_id=key[0], appointment_date=key[1], booked=booked)
+                 for key, _, booked in drift],
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['time_slot', 'appointment_date'],
+                update_fields=['booked'],
+            )
+    return drift
@@ -0,0 +1,130 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .cache import invalidate_doctors
+from .models import Doctor, DoctorRatingSummary, Review
+
+STAR_FIELDS = {
+    1: 'one_star',
+    2: 'two_star',
+    3: 'three_star',
+    4: 'four_star',
+    5: 'five_star',
+}
+SUMMARY_FIELDS = ['total_reviews', 'rating_sum', *STAR_FIELDS.values()]
+
+
+def rating_aggregates():
+    aggregates = {
+        'total_reviews': Count('id'),
+        'rating_sum': Sum('rating', default=0),
+    }
+    for stars, field in STAR_FIELDS.items():
+        aggregates[field] = Count('id', filter=Q(rating=stars))
+    return aggregates
+
+
+def aggregate_rating_summary(doctor):
+    stats = Review.objects.filter(doctor=doctor, is_approved=True).aggregate(**rating_aggregates())
+    return DoctorRatingSummary(doctor=doctor, **stats)
+
+
+def rating_stats(doctor):
+    return summary_stats(getattr(doctor, 'rating_summary', None) or aggregate_rating_summary(doctor))
+
+
+async def arating_stats(doctor_id):
+    summary = await DoctorRatingSummary.objects.filter(doctor_id=doctor_id).afirst()
+    if summary is None:
+        stats = await Review.objects.filter(doctor_id=doctor_id, is_approved=True).aaggregate(**rating_aggregates())
+        summary = DoctorRatingSummary(doctor_id=doctor_id, **stats)
+    return summary_stats(summary)
+
+
+def summary_stats(summary):
+    total = summary.total_reviews
+
+    stats = {
+        'total_reviews': total,
+        'average_rating': summary.average_rating,
+        'rating_breakdown': [],
+    }
+    for stars, field in STAR_FIELDS.items():
+        count = getattr(summary, field)
+        stats[field] = count
+        stats['rating_breakdown'].append({
+            'stars': stars,
+            'count': count,
+            'percentage': round(count / total * 100, 1) if total else 0,
+        })
+    return stats
+
+
+def rebuild_rating_summaries(doctor_ids=None):
+    reviews = Review.objects.filter(is_approved=True)
+    if doctor_ids is not None:
+        reviews = reviews.filter(doctor_id__in=doctor_ids)
+    else:
+        doctor_ids = Doctor.objects.values_list('id', flat=True)
+
+    rows = {row.pop('doctor_id'): row for row in reviews.values('doctor_id').annotate(**rating_aggregates()).order_by()}
+    summaries = [DoctorRatingSummary(doctor_id=doctor_id, **rows.get(doctor_id, {})) for doctor_id in doctor_ids]
+    DoctorRatingSummary.objects.bulk_create(
+        summaries,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['doctor'],
+        update_fields=SUMMARY_FIELDS,
+    )
+    return len(summaries)
+
+
+def ensure_rating_summaries(doctor_ids):
+    existing = set(DoctorRatingSummary.objects.filter(doctor_id__in=doctor_ids).values_list('doctor_id', flat=True))
+    missing = set(doctor_ids) - existing
+    if missing:
+        rebuild_rating_summaries(missing)
+
+
+def apply_rating_delta(doctor_id, rating, count=1):
+    field = STAR_FIELDS[rating]
+    updated = DoctorRatingSummary.objects.filter(doctor_id=doctor_id).update(**{
+        'total_reviews': F('total_reviews') + count,
+        'rating_sum': F('rating_sum') + count * rating,
+        field: F(field) + count,
+    })
+    # A missing row means the summary was never built for this doctor, so the
+    # review table (which already holds this change) is the source of truth.
+    if not updated and count > 0:
+        rebuild_rating_summaries([doctor_id])
+
+
+def review_changed(previous, review):
+    was_approved = bool(previous and previous['is_approved'])
+    if was_approved and review.is_approved and \
+            previous['doctor_id'] == review.doctor_id and previous['rating'] == review.rating:
+        return
+    if was_approved:
+        apply_rating_delta(previous['doctor_id'], previous['rating'], -1)
+    if review.is_approved:
+        apply_rating_delta(review.doctor_id, review.rating, 1)
+
+
+def set_reviews_approval(queryset, approved):
+    with transaction.atomic():
+        changed = list(
+            queryset.filter(is_approved=not approved).select_for_update().values_list('pk', 'doctor_id', 'rating')
+        )
+        if not changed:
+            return 0
+        ensure_rating_summaries({doctor_id for _, doctor_id, _ in changed})
+        Review.objects.filter(pk__in=[pk for pk, _, _ in changed]).update(is_approved=approved)
+
+        sign = 1 if approved else -1
+        deltas = Counter((doctor_id, rating) for _, doctor_id, rating in changed)
+        for (doctor_id, rating), count in deltas.items():
+            apply_rating_delta(doctor_id, rating, sign * count)
+        invalidate_doctors({doctor_id for doctor_id, _ in deltas})
+    return len(changed)
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AuthToken, CustomUser, Doctor
+
+
+def register_user(user_data, doctor_data=None):
+    """
+    Create the user, its Doctor profile when ``doctor_data`` is given, and a
+    fresh token in one transaction, so a failure never leaves an orphan user.
+
+    Returns ``(user, doctor, token)``; ``doctor`` is None for patients.
+    """
+    with transaction.atomic():
+        user = CustomUser.objects.create_user(**user_data)
+        doctor = Doctor.objects.create(user=user, **doctor_data) if doctor_data is not None else None
+        # A new user has no token to reuse, so skip the lookup in AuthToken.objects.issue().
+        now = timezone.now()
+        token = AuthToken.objects.create(user=user, last_used=now, expires_at=now + AuthToken.lifetime())
+    return user, doctor, token
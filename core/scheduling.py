@@ -0,0 +1,229 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+
+from .cache import invalidate_doctors
+from .models import Appointment, Doctor, TimeSlot
+
+DAY_START = time.min
+DAY_END = time.max
+
+
+class IntervalIndex:
+    """
+    Sorted ``(start, end, payload)`` intervals of a single weekday.
+
+    Overlap, gap and "next free time" lookups are binary searches over the
+    sorted starts, the running maximum of the ends and the merged busy blocks,
+    so they stay O(log n) even if stored intervals overlap each other.
+    """
+
+    def __init__(self, intervals=()):
+        self.items = sorted(intervals, key=lambda item: item[:2])
+        self.starts = [start for start, _, _ in self.items]
+        self.reach = []
+        self.busy = []
+        for start, end, _ in self.items:
+            self.reach.append(max(end, self.reach[-1]) if self.reach else end)
+            if self.busy and start <= self.busy[-1][1]:
+                self.busy[-1][1] = max(self.busy[-1][1], end)
+            else:
+                self.busy.append([start, end])
+        self.busy_starts = [start for start, _ in self.busy]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def overlapping(self, start, end):
+        """Every interval intersecting ``[start, end)``, ordered by start."""
+        first = bisect_right(self.reach, start)
+        last = bisect_left(self.starts, end)
+        return [item for item in self.items[first:last] if item[1] > start]
+
+    def conflict(self, start, end):
+        """The first interval intersecting ``[start, end)``, or None."""
+        # reach is non-decreasing, so the first position where it passes
+        # ``start`` is an interval that itself ends after ``start``.
+        first = bisect_right(self.reach, start)
+        if first < len(self.items) and self.items[first][0] < end:
+            return self.items[first]
+        return None
+
+    def gap_at(self, moment):
+        """The free ``(start, end)`` gap containing ``moment``, or None if it is busy."""
+        position = bisect_right(self.busy_starts, moment)
+        if position and self.busy[position - 1][1] > moment:
+            return None
+        gap_start = self.busy[position - 1][1] if position else DAY_START
+        gap_end = self.busy[position][0] if position < len(self.busy) else DAY_END
+        return gap_start, gap_end
+
+    def next_free(self, moment, minutes=None):
+        """
+        The earliest free ``(start, end)`` interval at or after ``moment``,
+        at least ``minutes`` long if given, or None.
+        """
+        position = bisect_right(self.busy_starts, moment)
+        if position and self.busy[position - 1][1] > moment:
+            moment = self.busy[position - 1][1]
+        while True:
+            end = self.busy[position][0] if position < len(self.busy) else DAY_END
+            if minutes is None or _minutes_between(moment, end) >= minutes:
+                return (moment, end) if moment < end else None
+            if position >= len(self.busy):
+                return None
+            moment = self.busy[position][1]
+            position += 1
+
+
+def _minutes_between(start, end):
+    return (datetime.combine(date.min, end) - datetime.combine(date.min, start)).total_seconds() / 60
+
+
+def appointment_minutes(slot):
+    # A zero step would never advance past the slot start.
+    minutes = slot.get_appointment_minutes()
+    if minutes is None or minutes <= 0:
+        raise ValueError(f'مدت هر نوبت باید مثبت باشد، نه {minutes}')
+    return minutes
+
+
+def booked_times(doctor, appointment_date):
+    return set(Appointment.objects.filter(
+        doctor=doctor, appointment_date=appointment_date, status__in=Appointment.ACTIVE_STATUSES,
+    ).values_list('appointment_time', flat=True).order_by())
+
+
+def bookable_times(slot, appointment_date, booked=None):
+    """
+    Lazily yield the appointment start times inside ``slot`` on
+    ``appointment_date`` that are not booked yet.
+
+    ``booked`` is a set of taken times for the slot's doctor on that date;
+    when omitted it is loaded with one query on first iteration.
+    """
+    step = timedelta(minutes=appointment_minutes(slot))
+    if booked is None:
+        booked = booked_times(slot.doctor_id, appointment_date)
+    moment = datetime.combine(appointment_date, slot.start_time)
+    end = datetime.combine(appointment_date, slot.end_time)
+    while moment + step <= end:
+        if moment.time() not in booked:
+            yield moment.time()
+        moment += step
+
+
+def is_slot_start(slot, moment):
+    """Whether ``moment`` is one of the appointment start times of ``slot``."""
+    offset = _minutes_between(slot.start_time, moment)
+    minutes = appointment_minutes(slot)
+    return offset >= 0 and offset % minutes == 0 and _minutes_between(moment, slot.end_time) >= minutes
+
+
+def slot_indexes(slots):
+    """Group time slots into one ``IntervalIndex`` per weekday, with the slots as payloads."""
+    by_day = defaultdict(list)
+    for slot in slots:
+        by_day[slot.day_of_week].append((slot.start_time, slot.end_time, slot))
+    return defaultdict(IntervalIndex, {day: IntervalIndex(items) for day, items in by_day.items()})
+
+
+def sweep_conflicts(existing, candidates):
+    """
+    Find the candidates that overlap an existing interval or an earlier
+    accepted candidate, for intervals of a single weekday.
+
+    Both arguments are lists of ``(start, end, label)`` tuples. Returns a dict
+    mapping candidate positions to the label they conflict with. Existing
+    intervals always win; among candidates the earliest start wins.
+    """
+    conflicts = {}
+    existing = sorted(existing)
+    order = sorted(range(len(candidates)), key=lambda i: candidates[i][:2])
+
+    # Pass 1: candidates against the stored schedule. Walking the candidates
+    # by start, ``reach`` is the stored interval with the latest end among
+    # those starting at or before the candidate, and ``existing[pointer]`` is
+    # the first one starting after it; only those two can overlap.
+    pointer = 0
+    reach = None
+    for i in order:
+        start, end, _ = candidates[i]
+        while pointer < len(existing) and existing[pointer][0] <= start:
+            if reach is None or existing[pointer][1] > reach[1]:
+                reach = existing[pointer]
+            pointer += 1
+        if reach is not None and reach[1] > start:
+            conflicts[i] = reach[2]
+        elif pointer < len(existing) and existing[pointer][0] < end:
+            conflicts[i] = existing[pointer][2]
+
+    # Pass 2: surviving candidates against each other.
+    accepted = None
+    for i in order:
+        if i in conflicts:
+            continue
+        start, end, label = candidates[i]
+        if accepted is not None and accepted[1] > start:
+            conflicts[i] = accepted[2]
+        elif accepted is None or end > accepted[1]:
+            accepted = (start, end, label)
+    return conflicts
+
+
+def create_time_slots(doctor, items, partial=False, errors=None):
+    """
+    Validate a batch of ``(index, slot dict)`` pairs for ``doctor`` against
+    each other and the stored schedule, then insert the valid ones with one
+    ``bulk_create``.
+
+    Returns ``(created, errors)`` where errors maps indexes to messages and
+    starts from ``errors`` (e.g. field errors of items that were left out).
+    Unless ``partial`` is set, any error aborts the whole batch.
+    """
+    with transaction.atomic():
+        Doctor.objects.select_for_update().filter(pk=doctor.pk).first()
+        stored = list(TimeSlot.objects.filter(doctor=doctor).values_list(
+            'day_of_week', 'start_time', 'end_time', 'is_available'
+        ))
+
+        existing = defaultdict(list)
+        taken_starts = set()
+        for day, start, end, is_available in stored:
+            taken_starts.add((day, start))
+            if is_available:
+                existing[day].append((start, end, f'{start:%H:%M}-{end:%H:%M}'))
+
+        items = dict(items)
+        errors = dict(errors or {})
+        by_day = defaultdict(list)
+        for index, item in items.items():
+            key = (item['day_of_week'], item['start_time'])
+            if key in taken_starts:
+                errors[index] = f'بازه‌ای با شروع {item["start_time"]:%H:%M} در این روز وجود دارد'
+                continue
+            taken_starts.add(key)
+            if item.get('is_available', True):
+                by_day[item['day_of_week']].append(index)
+
+        for day, indexes in by_day.items():
+            candidates = [(items[i]['start_time'], items[i]['end_time'], i) for i in indexes]
+            for position, label in sweep_conflicts(existing[day], candidates).items():
+                if isinstance(label, int):
+                    label = f'{items[label]["start_time"]:%H:%M}-{items[label]["end_time"]:%H:%M}'
+                errors[indexes[position]] = f'این بازه زمانی با بازه {label} تداخل دارد'
+
+        if errors and not partial:
+            return [], errors
+
+        created = TimeSlot.objects.bulk_create([
+            TimeSlot(doctor=doctor, **item) for index, item in items.items() if index not in errors
+        ])
+        if created:
+            invalidate_doctors([doctor.pk])
+    return created, errors
@@ -1,5 +1,10 @@
+from datetime import date, datetime, timedelta
+
 from rest_framework.fields import SerializerMethodField, ReadOnlyField, CharField
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
+from .booking import book_appointment
 from .models import *
 from django.contrib.auth import get_user_model
 
@@ -35,6 +40,74 @@ class TimeSlotSerializer(ModelSerializer):
         fields = '__all__'
 
 
+class TimeSlotItemSerializer(ModelSerializer):
+    class Meta:
+        model = TimeSlot
+        fields = ['day_of_week', 'start_time', 'end_time', 'max_patients', 'is_available', 'appointment_minutes']
+
+    def validate(self, data):
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError('ساعت شروع باید قبل از ساعت پایان باشد')
+        return data
+
+
+class ScheduleRuleSerializer(serializers.Serializer):
+    days = serializers.ListField(child=serializers.ChoiceField(choices=TimeSlot.DAY_OF_WEEK), allow_empty=False)
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    slot_minutes = serializers.IntegerField(min_value=MIN_APPOINTMENT_MINUTES, required=False)
+    max_patients = serializers.IntegerField(min_value=1, default=1)
+
+    def validate(self, data):
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError('ساعت شروع باید قبل از ساعت پایان باشد')
+        return data
+
+    @staticmethod
+    def expand(rule):
+        first = datetime.combine(date.min, rule['start_time'])
+        end = datetime.combine(date.min, rule['end_time'])
+        step = timedelta(minutes=rule['slot_minutes']) if 'slot_minutes' in rule else end - first
+        items = []
+        for day_of_week in sorted(set(rule['days'])):
+            start = first
+            while start < end:
+                items.append({
+                    'day_of_week': day_of_week,
+                    'start_time': start.time(),
+                    'end_time': min(start + step, end).time(),
+                    'max_patients': rule['max_patients'],
+                })
+                start += step
+        return items
+
+
+class BulkTimeSlotSerializer(serializers.Serializer):
+    doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all(), required=False)
+    slots = serializers.ListField(child=serializers.DictField(), required=False, max_length=500)
+    rule = ScheduleRuleSerializer(required=False)
+    partial = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if ('slots' in data) == ('rule' in data):
+            raise serializers.ValidationError('دقیقاً یکی از slots یا rule را بفرستید')
+        return data
+
+    def items(self):
+        """Return ``(items, errors)``: ``(index, slot)`` pairs and per-index field errors."""
+        if 'rule' in self.validated_data:
+            return list(enumerate(ScheduleRuleSerializer.expand(self.validated_data['rule']))), {}
+
+        items, errors = [], {}
+        for index, raw in enumerate(self.validated_data['slots']):
+            item = TimeSlotItemSerializer(data=raw)
+            if item.is_valid():
+                items.append((index, item.validated_data))
+            else:
+                errors[index] = item.errors
+        return items, errors
+
+
 class AppointmentSerializer(ModelSerializer):
     patient = UserSerializer(read_only=True)
     doctor = DoctorSerializer(read_only=True)
@@ -48,6 +121,14 @@ class CreateAppointmentSerializer(ModelSerializer):
     class Meta:
         model = Appointment
         fields = ['doctor', 'appointment_date', 'appointment_time', 'symptoms']
+        # book_appointment checks the time and the capacity under the occupancy lock.
+        validators = []
+
+    def create(self, validated_data):
+        try:
+            return book_appointment(**validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
 
 
 class ReviewSerializer(ModelSerializer):
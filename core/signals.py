@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import token_cache
+from .cache import invalidate_doctors
+from .models import Appointment, AuthToken, CustomUser, Doctor, Review, TimeSlot
+from .occupancy import apply_occupancy_delta
+from .ratings import apply_rating_delta
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    if instance.is_approved:
+        apply_rating_delta(instance.doctor_id, instance.rating, -1)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    if instance.status in Appointment.ACTIVE_STATUSES:
+        apply_occupancy_delta(instance.time_slot_id, instance.appointment_date, -1)
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    invalidate_doctors([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=TimeSlot)
+@receiver([post_save, post_delete], sender=Review)
+def doctor_related_changed(sender, instance, **kwargs):
+    invalidate_doctors([instance.doctor_id])
+
+
+@receiver(post_delete, sender=AuthToken)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    changed = set() if created else instance.changed_cached_fields()
+    if update_fields is not None:
+        changed &= set(update_fields)
+    instance.remember_cached_fields()
+    # Saves that only touch other fields (last_login, password...) skip the lookups below.
+    if not changed:
+        return
+
+    # Cached authentication records hold a copy of the user (is_active, is_staff, names...).
+    token_keys = list(AuthToken.objects.filter(user=instance).values_list('key', flat=True))
+    if token_keys:
+        token_cache.invalidate(*token_keys)
+
+    if not changed & {'first_name', 'last_name'}:
+        return
+    # Doctor names appear in the doctor endpoints, patient names in their approved reviews.
+    doctor_ids = set(Review.objects.filter(patient=instance, is_approved=True).values_list('doctor_id', flat=True))
+    if instance.is_doctor:
+        doctor_ids.update(Doctor.objects.filter(user=instance).values_list('id', flat=True))
+    if doctor_ids:
+        invalidate_doctors(doctor_ids)
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -1,3 +1,1344 @@
-from django.test import TestCase
+from base64 import urlsafe_b64encode
+from datetime import time, timedelta
+import csv
+import json
+import logging
+import os
+import tempfile
+import threading
+from io import StringIO
+from time import sleep
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from Reserve.database import database_config, disable_persistent_connections
+
+from .admin import AppointmentAdmin, ReviewAdmin
+from .authentication import token_cache
+from .benchmark import DatasetFactory, run_benchmarks
+from .booking import book_appointment
+from .cache import cache_stats, versions_are_shared
+from .export import aexport_lines, jsonl_lines
+from .index_audit import audit_views, explain, full_scans
+from .pagination import StandardPagination
+from .log import QueuedJsonHandler, redact, request_id
+from .middleware import QueryStats
+from .models import Appointment, AuthToken, CustomUser, Doctor, DoctorRatingSummary, Review, SlotOccupancy, TimeSlot
+from .ratings import aggregate_rating_summary, rating_stats, set_reviews_approval
+from .scheduling import IntervalIndex, is_slot_start, sweep_conflicts
+from .serializers import DoctorSerializer
+from .views import ReviewViewSet
+
+
+def make_doctor(username='doctor', specialization='cardiologist', fee=100):
+    user = CustomUser.objects.create_user(username=username, password='x', user_type='doctor',
+                                          first_name='Ali', last_name=username)
+    return Doctor.objects.create(user=user, specialization=specialization, phone='0912', address='Tehran',
+                                 experience=5, fee=fee)
+
+
+def make_patient(username='patient'):
+    return CustomUser.objects.create_user(username=username, password='x', user_type='patient')
+
+
+def make_slot(doctor, day_of_week=0, start=time(9), end=time(12), max_patients=1):
+    return TimeSlot.objects.create(doctor=doctor, day_of_week=day_of_week, start_time=start, end_time=end,
+                                   max_patients=max_patients)
+
+
+def next_weekday(day_of_week, after=None):
+    day = after or timezone.now().date() + timedelta(days=1)
+    while (day.weekday() + 2) % 7 != day_of_week:
+        day += timedelta(days=1)
+    return day
+
+
+def make_review(doctor, patient, rating, is_approved=True):
+    slot = doctor.timeslot.first() or make_slot(doctor)
+    appointment = Appointment.objects.create(
+        patient=patient, doctor=doctor, time_slot=slot, status='completed',
+        appointment_date=next_weekday(slot.day_of_week) + timedelta(weeks=Appointment.objects.count()),
+        appointment_time=slot.start_time,
+    )
+    return Review.objects.create(patient=patient, doctor=doctor, appointment=appointment, rating=rating,
+                                 is_approved=is_approved)
+
+
+class RatingSummaryTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+
+    def summary(self):
+        return DoctorRatingSummary.objects.get(doctor=self.doctor)
+
+    def test_summary_follows_review_lifecycle(self):
+        review = make_review(self.doctor, self.patient, 4, is_approved=False)
+        self.assertFalse(DoctorRatingSummary.objects.filter(doctor=self.doctor).exists())
+
+        review.is_approved = True
+        review.save()
+        make_review(self.doctor, self.patient, 2)
+        summary = self.summary()
+        self.assertEqual((summary.total_reviews, summary.rating_sum), (2, 6))
+        self.assertEqual((summary.two_star, summary.four_star), (1, 1))
+        self.assertEqual(summary.average_rating, 3.0)
+
+        review.rating = 5
+        review.save()
+        self.assertEqual((self.summary().four_star, self.summary().five_star), (0, 1))
+
+        review.delete()
+        summary = self.summary()
+        self.assertEqual((summary.total_reviews, summary.rating_sum, summary.five_star), (1, 2, 0))
+
+    def test_previous_review_is_read_inside_the_transaction(self):
+        review = make_review(self.doctor, self.patient, 4, is_approved=False)
+        review.is_approved = True
+        with CaptureQueriesContext(connection) as queries:
+            review.save()
+        sql = [query['sql'] for query in queries]
+        savepoint = next(i for i, query in enumerate(sql) if query.startswith('SAVEPOINT'))
+        previous = next(i for i, query in enumerate(sql) if query.startswith('SELECT "core_review"."doctor_id"'))
+        self.assertLess(savepoint, previous)
+        self.assertEqual(self.summary().total_reviews, 1)
+
+    def test_bulk_approval_updates_summary(self):
+        make_review(self.doctor, self.patient, 5, is_approved=False)
+        make_review(self.doctor, self.patient, 3, is_approved=False)
+
+        self.assertEqual(set_reviews_approval(Review.objects.all(), True), 2)
+        self.assertEqual(self.summary().rating_sum, 8)
+        self.assertEqual(set_reviews_approval(Review.objects.filter(rating=5), False), 1)
+        self.assertEqual((self.summary().total_reviews, self.summary().rating_sum), (1, 3))
+        self.assertEqual(set_reviews_approval(Review.objects.filter(rating=5), False), 0)
+
+    def test_admin_actions_use_incremental_update(self):
+        make_review(self.doctor, self.patient, 4, is_approved=False)
+        admin = ReviewAdmin(Review, None)
+        admin.message_user = lambda request, message: None
+
+        admin.approve_reviews(None, Review.objects.all())
+        self.assertEqual(self.summary().total_reviews, 1)
+        admin.disapprove_reviews(None, Review.objects.all())
+        self.assertEqual(self.summary().total_reviews, 0)
+
+    def test_rebuild_command_repairs_drift(self):
+        make_review(self.doctor, self.patient, 5)
+        DoctorRatingSummary.objects.filter(doctor=self.doctor).update(total_reviews=40, rating_sum=1)
+
+        call_command('rebuild_rating_summaries', stdout=StringIO())
+        summary = self.summary()
+        self.assertEqual((summary.total_reviews, summary.rating_sum, summary.five_star), (1, 5, 1))
+
+    def test_doctor_list_reads_summary_without_extra_queries(self):
+        make_review(self.doctor, self.patient, 4)
+        for i in range(3):
+            make_doctor(f'doctor{i}')
+
+        # The validators, the count and the page.
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/doctors/')
+        ratings = {row['id']: (row['average_rating'], row['total_reviews']) for row in response.json()['results']}
+        self.assertEqual(ratings[self.doctor.id], (4.0, 1))
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        make_slot(self.doctor)
+        make_slot(self.doctor, day_of_week=1, start=time(14), end=time(16))
+        self.patient = make_patient()
+        for rating in (5, 4, 3):
+            make_review(self.doctor, self.patient, rating)
+        self.token = AuthToken.objects.issue(self.patient).key
+
+    def both(self, path, params=None, headers=None):
+        sync = self.client.get(f'/api/{path}', params, headers=headers)
+        async_ = async_to_sync(self.async_client.get)(f'/api/async/{path}', params, headers=headers)
+        return sync, async_
+
+    def test_payloads_match_the_sync_views(self):
+        auth = {'Authorization': f'Token {self.token}'}
+        for path, params, headers in [
+            ('doctors/', {'page_size': 1}, {}),
+            (f'doctors/{self.doctor.id}/', None, {}),
+            (f'doctors/{self.doctor.id}/time_slot/', None, auth),
+            (f'doctors/{self.doctor.id}/availability/', {'time_from': '09:30', 'time_to': '11:00'}, {}),
+            (f'doctors/{self.doctor.id}/reviews/', {'page_size': 2}, {}),
+            (f'doctors/{self.doctor.id}/rating-stats/', None, {}),
+        ]:
+            with self.subTest(path=path):
+                sync, async_ = self.both(path, params, headers)
+                self.assertEqual(async_.status_code, 200)
+                self.assertEqual(async_.content.replace(b'/api/async/', b'/api/'), sync.content)
+
+    def test_errors_match_the_sync_views(self):
+        for path, status in [
+            ('doctors/999/', 404),
+            ('doctors/999/reviews/', 404),
+            (f'doctors/{self.doctor.id}/time_slot/', 401),
+            (f'doctors/{self.doctor.id}/availability/?from=bad', 400),
+            (f'doctors/{self.doctor.id}/reviews/?cursor=garbage', 404),
+            ('doctors/?page=5', 404),
+        ]:
+            with self.subTest(path=path):
+                sync, async_ = self.both(path)
+                self.assertEqual((async_.status_code, async_.json()), (status, sync.json()))
+
+    def test_last_page_matches_the_sync_view(self):
+        sync, async_ = self.both('doctors/', {'page': 'last'})
+        self.assertEqual(async_.status_code, 200)
+        self.assertEqual(async_.content.replace(b'/api/async/', b'/api/'), sync.content)
+
+    def test_unsafe_methods_are_not_allowed(self):
+        self.async_client.enforce_csrf_checks = True
+        for method in ('post', 'put', 'delete'):
+            with self.subTest(method=method):
+                response = async_to_sync(getattr(self.async_client, method))(f'/api/async/doctors/{self.doctor.id}/')
+                self.assertEqual(response.status_code, 405)
+
+    @mock.patch('core.cache.LOCAL_BACKENDS', ())
+    def test_reviews_run_three_queries_and_honour_etags(self):
+        get = async_to_sync(self.async_client.get)
+        path = f'/api/async/doctors/{self.doctor.id}/reviews/'
+        instrumentation = {**settings.QUERY_INSTRUMENTATION, 'SAMPLE_RATE': 1.0}
+        # The doctor, the rating summary and the review page.
+        with self.assertNumQueries(3), override_settings(QUERY_INSTRUMENTATION=instrumentation):
+            response = get(path, headers={'X-Request-ID': 'async-1'})
+        self.assertEqual(response.json()['stats']['total_reviews'], 3)
+        self.assertEqual(response['X-Request-ID'], 'async-1')
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+        self.assertEqual(get(path, headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+
+class RatingStatsTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        patient = make_patient()
+        for rating in (5, 5, 4, 1):
+            make_review(self.doctor, patient, rating)
+        make_review(self.doctor, patient, 2, is_approved=False)
+
+    def test_rating_stats_view_runs_one_query(self):
+        # After the validators.
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/doctors/{self.doctor.id}/rating-stats/')
+        stats = response.json()['stats']
+        self.assertEqual(stats['total_reviews'], 4)
+        self.assertEqual(stats['average_rating'], 3.8)
+        self.assertEqual([row['count'] for row in stats['rating_breakdown']], [1, 0, 0, 1, 2])
+        self.assertEqual(stats['rating_breakdown'][4]['percentage'], 50.0)
+
+    def test_aggregate_matches_summary_in_one_query(self):
+        with self.assertNumQueries(1):
+            summary = aggregate_rating_summary(self.doctor)
+        doctor = Doctor.objects.select_related('rating_summary').get(pk=self.doctor.pk)
+        DoctorRatingSummary.objects.all().delete()
+        self.assertEqual(rating_stats(doctor), rating_stats(Doctor.objects.get(pk=self.doctor.pk)))
+        self.assertEqual((summary.total_reviews, summary.rating_sum), (4, 15))
+
+    def test_reviews_and_stats_endpoints_agree(self):
+        reviews = self.client.get(f'/api/doctors/{self.doctor.id}/reviews/').json()
+        stats = self.client.get(f'/api/doctors/{self.doctor.id}/rating-stats/').json()
+        self.assertEqual(reviews['stats'], stats['stats'])
+        self.assertEqual(len(reviews['reviews']), 4)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.morning = make_slot(self.doctor, day_of_week=0, max_patients=2)
+        self.evening = make_slot(self.doctor, day_of_week=0, start=time(16), end=time(18))
+        make_slot(self.doctor, day_of_week=3)
+        self.saturday = next_weekday(0)
+        patient = make_patient()
+        for slot, minute in ((self.morning, 0), (self.evening, 0), (self.morning, 30)):
+            Appointment.objects.create(patient=patient, doctor=self.doctor, time_slot=slot,
+                                       appointment_date=self.saturday, appointment_time=time(slot.start_time.hour, minute))
+        Appointment.objects.get(appointment_time=time(9, 30)).cancel()
+
+    def test_range_is_expanded_from_three_queries(self):
+        date_to = self.saturday + timedelta(days=29)
+        # The doctor lookup, then one slot fetch, one grouped count and one
+        # booked-times fetch for the whole range.
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/doctors/{self.doctor.id}/availability/',
+                                       {'from': self.saturday.isoformat(), 'to': date_to.isoformat()})
+        slots = response.json()['slots']
+        self.assertEqual(len(slots), 5 + 4 + 4)
+        first = slots[0]
+        self.assertEqual((first['date'], first['time_slot'], first['booked'], first['free']),
+                         (self.saturday.isoformat(), self.morning.id, 1, 1))
+        self.assertEqual(first['times'], ['09:30:00', '10:00:00', '10:30:00', '11:00:00', '11:30:00'])
+        self.assertNotIn((self.saturday.isoformat(), self.evening.id),
+                         [(slot['date'], slot['time_slot']) for slot in slots])
+
+    def test_time_window_filters_slots(self):
+        response = self.client.get(f'/api/doctors/{self.doctor.id}/availability/',
+                                   {'from': self.saturday.isoformat(), 'to': (self.saturday + timedelta(days=7)).isoformat(),
+                                    'time_from': '13:00'})
+        self.assertEqual({slot['time_slot'] for slot in response.json()['slots']}, {self.evening.id})
+
+    def test_time_window_filters_times_inside_a_slot(self):
+        day = {'from': self.saturday.isoformat(), 'to': self.saturday.isoformat()}
+        response = self.client.get(f'/api/doctors/{self.doctor.id}/availability/',
+                                   {**day, 'time_from': '10:00', 'time_to': '11:00'})
+        self.assertEqual([(slot['time_slot'], slot['times']) for slot in response.json()['slots']],
+                         [(self.morning.id, ['10:00:00', '10:30:00'])])
+
+        response = self.client.get(f'/api/doctors/{self.doctor.id}/availability/', {**day, 'time_from': '11:45'})
+        self.assertEqual([slot['time_slot'] for slot in response.json()['slots']], [])
+
+    def test_invalid_range_is_rejected(self):
+        url = f'/api/doctors/{self.doctor.id}/availability/'
+        self.assertEqual(self.client.get(url, {'from': 'tomorrow'}).status_code, 400)
+        far = self.saturday + timedelta(days=90)
+        self.assertEqual(self.client.get(url, {'to': far.isoformat()}).status_code, 400)
+
+
+class AvailabilitySearchTests(TestCase):
+    def setUp(self):
+        self.saturday = next_weekday(0)
+        self.cardiologists = []
+        for i in range(5):
+            doctor = make_doctor(f'cardio{i}', fee=100 + i * 50)
+            make_slot(doctor, day_of_week=0, start=time(14), end=time(17))
+            make_slot(doctor, day_of_week=0, start=time(8), end=time(10))
+            self.cardiologists.append(doctor)
+        make_slot(make_doctor('dentist', specialization='dentist'), day_of_week=0, start=time(14), end=time(17))
+        Appointment.objects.create(patient=make_patient(), doctor=self.cardiologists[0],
+                                   time_slot=self.cardiologists[0].timeslot.get(start_time=time(14)),
+                                   appointment_date=self.saturday, appointment_time=time(14))
+
+    def search(self, **params):
+        params.setdefault('from', self.saturday.isoformat())
+        params.setdefault('to', self.saturday.isoformat())
+        return self.client.get('/api/doctors/search/', {'specialization': 'cardiologist', **params})
+
+    def test_query_count_is_independent_of_matches(self):
+        with self.assertNumQueries(4):
+            response = self.search(time_from='12:00', max_fee=250)
+        results = response.json()['results']
+        self.assertEqual([row['doctor']['id'] for row in results], [d.id for d in self.cardiologists[1:4]])
+        self.assertEqual({slot['start_time'] for row in results for slot in row['earliest_slots']}, {'14:00:00'})
+
+    def test_window_limits_the_returned_times(self):
+        all_day = make_doctor('all_day', fee=50)
+        make_slot(all_day, day_of_week=0, start=time(8), end=time(17))
+        busy = make_doctor('busy', fee=50)
+        make_slot(busy, day_of_week=0, start=time(8), end=time(15), max_patients=10)
+        for minute in (0, 30):
+            book_appointment(make_patient(f'patient{minute}'), busy, self.saturday, time(14, minute))
+
+        results = self.search(time_from='14:00', time_to='15:00', max_fee=50).json()['results']
+        slots = {row['doctor']['id']: row['earliest_slots'] for row in results}
+        self.assertEqual(list(slots), [all_day.id])
+        self.assertEqual(slots[all_day.id][0]['times'], ['14:00:00', '14:30:00'])
+
+    def test_keyset_pagination(self):
+        first = self.search(limit=2).json()
+        self.assertEqual(len(first['results']), 2)
+        second = self.search(limit=2, cursor=first['next_cursor']).json()
+        third = self.search(limit=2, cursor=second['next_cursor']).json()
+        ids = [row['doctor']['id'] for page in (first, second, third) for row in page['results']]
+        self.assertEqual(ids, [d.id for d in self.cardiologists])
+        self.assertIsNone(third['next_cursor'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.search(time_from='afternoon').status_code, 400)
+        self.assertEqual(self.search(max_fee='cheap').status_code, 400)
+
+
+class BookingTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.slot = make_slot(self.doctor, max_patients=2)
+        self.patient = make_patient()
+        self.saturday = next_weekday(0)
+
+    def test_api_booking_resolves_time_slot(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.post('/api/appointments/', {
+            'doctor': self.doctor.id, 'appointment_date': self.saturday.isoformat(), 'appointment_time': '09:30',
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        appointment = Appointment.objects.get()
+        self.assertEqual((appointment.patient, appointment.time_slot), (self.patient, self.slot))
+
+        response = self.client.post('/api/appointments/', {
+            'doctor': self.doctor.id, 'appointment_date': self.saturday.isoformat(), 'appointment_time': '13:00',
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_cancelled_time_can_be_booked_again(self):
+        self.client.force_authenticate(self.patient)
+        data = {'doctor': self.doctor.id, 'appointment_date': self.saturday.isoformat(), 'appointment_time': '09:30'}
+        self.assertEqual(self.client.post('/api/appointments/', data).status_code, 201)
+        self.assertEqual(self.client.post('/api/appointments/', data).status_code, 400)
+
+        Appointment.objects.get().cancel()
+        self.assertIn(time(9, 30), list(self.slot.bookable_times(self.saturday)))
+        response = self.client.post('/api/appointments/', data)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(sorted(Appointment.objects.values_list('status', flat=True)), ['cancelled', 'pending'])
+
+    def test_times_follow_the_appointment_length(self):
+        self.assertEqual(len(list(self.slot.bookable_times(self.saturday))), 6)
+        self.slot.appointment_minutes = 45
+        self.slot.save()
+        book_appointment(self.patient, self.doctor, self.saturday, time(9, 45))
+        with self.assertNumQueries(1):
+            times = list(self.slot.bookable_times(self.saturday))
+        self.assertEqual(times, [time(9), time(10, 30), time(11, 15)])
+
+    def test_appointment_length_must_be_positive(self):
+        serializer = DoctorSerializer(self.doctor, data={'appointment_minutes': 0}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('appointment_minutes', serializer.errors)
+
+        # Rows written around validation must not hang the slot expansion.
+        Doctor.objects.filter(pk=self.doctor.pk).update(appointment_minutes=0)
+        slot = TimeSlot.objects.select_related('doctor').get(pk=self.slot.pk)
+        with self.assertRaises(ValueError):
+            list(slot.bookable_times(self.saturday, booked=set()))
+        with self.assertRaises(ValueError):
+            is_slot_start(slot, time(9))
+
+    def test_time_must_start_an_appointment(self):
+        with self.assertRaisesMessage(ValidationError, 'زمان نوبت'):
+            book_appointment(self.patient, self.doctor, self.saturday, time(9, 10))
+        with self.assertRaisesMessage(ValidationError, 'زمان نوبت'):
+            book_appointment(self.patient, self.doctor, self.saturday, time(11, 45))
+
+    def test_past_appointments_stay_editable_but_cannot_be_created(self):
+        appointment = book_appointment(self.patient, self.doctor, self.saturday, time(9))
+        Appointment.objects.filter(pk=appointment.pk).update(appointment_date=self.saturday - timedelta(weeks=2))
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        appointment.cancel()
+        self.assertEqual(Appointment.objects.get().status, 'cancelled')
+
+        appointment.appointment_date -= timedelta(weeks=1)
+        with self.assertRaisesMessage(ValidationError, 'گذشته'):
+            appointment.save()
+
+    def test_cancelled_time_frees_its_capacity(self):
+        TimeSlot.objects.filter(pk=self.slot.pk).update(max_patients=3)
+        first = book_appointment(self.patient, self.doctor, self.saturday, time(9))
+        book_appointment(self.patient, self.doctor, self.saturday, time(10))
+        with self.assertRaisesMessage(ValidationError, 'قبلاً رزرو شده'):
+            book_appointment(self.patient, self.doctor, self.saturday, time(10))
+
+        first.cancel()
+        book_appointment(make_patient('other'), self.doctor, self.saturday, time(9))
+        self.assertEqual(SlotOccupancy.objects.get(time_slot=self.slot).booked, 2)
+
+    def test_capacity_is_enforced(self):
+        book_appointment(self.patient, self.doctor, self.saturday, time(9))
+        book_appointment(self.patient, self.doctor, self.saturday, time(10))
+        with self.assertRaisesMessage(ValidationError, 'ظرفیت'):
+            book_appointment(self.patient, self.doctor, self.saturday, time(11))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite tuning')
+class SQLiteTuningTests(TransactionTestCase):
+    def test_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            for pragma in ('busy_timeout', 'cache_size', 'synchronous'):
+                cursor.execute(f'PRAGMA {pragma}')
+                self.assertEqual(str(cursor.fetchone()[0]).upper(),
+                                 {'synchronous': '1'}.get(pragma, str(settings.SQLITE_PRAGMAS[pragma]).upper()))
+
+    def test_only_bookings_begin_immediate(self):
+        doctor = make_doctor()
+        make_slot(doctor)
+        patient = make_patient()
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                Appointment.objects.count()
+            book_appointment(patient, doctor, next_weekday(0), time(9))
+        begins = [q['sql'] for q in queries if q['sql'].startswith('BEGIN')]
+        self.assertEqual(begins, ['BEGIN', 'BEGIN IMMEDIATE'])
+        self.assertIsNone(connection.transaction_mode)
+
+
+class DatabaseConfigTests(SimpleTestCase):
+    def test_sqlite_url_is_relative_to_base_dir(self):
+        config = database_config('sqlite:///db.sqlite3', settings.BASE_DIR)
+        self.assertEqual(config['NAME'], settings.BASE_DIR / 'db.sqlite3')
+        self.assertEqual(config['OPTIONS'], {})
+
+    def test_postgres_pool_disables_persistent_connections(self):
+        config = database_config('postgres://app:p%40ss@db:5432/reserve?sslmode=require',
+                                 settings.BASE_DIR, conn_max_age=60, pool='2:10')
+        self.assertEqual((config['USER'], config['PASSWORD'], config['HOST'], config['PORT'], config['NAME']),
+                         ('app', 'p@ss', 'db', '5432', 'reserve'))
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['sslmode'], 'require')
+        self.assertEqual(config['OPTIONS']['pool'], {'min_size': 2, 'max_size': 10, 'timeout': 10})
+
+    def test_asgi_disables_persistent_connections(self):
+        databases = {'default': database_config('sqlite:///db.sqlite3', settings.BASE_DIR, conn_max_age=60)}
+        disable_persistent_connections(databases)
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 0)
+
+    def test_unknown_scheme_is_rejected(self):
+        with self.assertRaises(ValueError):
+            database_config('mysql://db/reserve', settings.BASE_DIR)
+
+
+class IndexAuditTests(TestCase):
+    def test_hot_queries_do_not_scan_whole_tables(self):
+        factory = DatasetFactory(doctors=3, patients=5, appointments=30, reviews=10)
+        doctors, patients = factory.seed()
+        results = audit_views(doctors[0], patients[0], next_weekday(0) + timedelta(weeks=10))
+        self.assertGreater(len(results), 20)
+        failures = [(result['view'], result['sql'], result['plan']) for result in results if result['full_scans']]
+        self.assertEqual(failures, [])
+
+    def test_full_scan_is_detected(self):
+        sql, params = Appointment.objects.filter(symptoms='x').query.sql_with_params()
+        self.assertEqual(full_scans(sql, explain(sql, params)), ['core_appointment'])
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    THREADS = 12
+    RETRIES = 100
+
+    def test_exactly_max_patients_bookings_succeed(self):
+        doctor = make_doctor()
+        doctor.appointment_minutes = 10
+        doctor.save()
+        make_slot(doctor, start=time(9), end=time(12), max_patients=3)
+        patient = make_patient()
+        saturday = next_weekday(0)
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def attempt(minute):
+            barrier.wait()
+            try:
+                for _ in range(self.RETRIES):
+                    try:
+                        book_appointment(patient, doctor, saturday, time(9 + minute // 60, minute % 60))
+                        outcomes.append('booked')
+                        return
+                    except OperationalError:
+                        # The shared-cache test database reports a locked table
+                        # at once instead of waiting for busy_timeout.
+                        sleep(0.01)
+                    except ValidationError:
+                        outcomes.append('rejected')
+                        return
+                outcomes.append('locked out')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(i * 10,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count('locked out'), 0)
+        self.assertEqual(outcomes.count('booked'), 3)
+        self.assertEqual(outcomes.count('rejected'), self.THREADS - 3)
+        self.assertEqual(Appointment.objects.filter(doctor=doctor).count(), 3)
+
+
+class SlotOccupancyTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.slot = make_slot(self.doctor, max_patients=3)
+        self.patient = make_patient()
+        self.saturday = next_weekday(0)
+
+    def booked(self):
+        return self.slot.max_patients - self.slot.get_available_slots(self.saturday)
+
+    def book(self, hour):
+        return book_appointment(self.patient, self.doctor, self.saturday, time(hour))
+
+    def test_counter_follows_status_transitions(self):
+        first, second = self.book(9), self.book(10)
+        self.assertEqual(self.booked(), 2)
+        first.confirm()
+        self.assertEqual(self.booked(), 2)
+        first.cancel('busy')
+        self.assertEqual(self.booked(), 1)
+        second.confirm()
+        second.complete(prescription='rest')
+        self.assertEqual(self.booked(), 0)
+        third = self.book(11)
+        third.confirm()
+        third.mark_no_show()
+        self.assertEqual(self.booked(), 0)
+        book_appointment(self.patient, self.doctor, self.saturday, time(9, 30)).delete()
+        self.assertEqual(self.booked(), 0)
+
+    def test_booking_relies_on_the_lock_and_the_constraint(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.book(9)
+        self.assertFalse([query['sql'] for query in queries if 'EXISTS' in query['sql']])
+        with self.assertRaisesMessage(ValidationError, 'قبلاً رزرو شده'):
+            self.book(9)
+        self.assertEqual(self.booked(), 1)
+
+        # Other saves still validate the time before writing.
+        second = self.book(10)
+        second.appointment_time = first.appointment_time
+        with self.assertRaisesMessage(ValidationError, 'قبلاً رزرو شده'):
+            second.save()
+
+    def test_previous_appointment_is_read_inside_the_transaction(self):
+        appointment = self.book(9)
+        appointment.status = 'cancelled'
+        with CaptureQueriesContext(connection) as queries:
+            appointment.save()
+        sql = [query['sql'] for query in queries]
+        update = next(i for i, query in enumerate(sql) if query.startswith('UPDATE "core_appointment"'))
+        # The savepoint of the save itself, after the one the constraint check opens and releases.
+        savepoint = max(i for i, query in enumerate(sql[:update]) if query.startswith('SAVEPOINT'))
+        previous = next(i for i, query in enumerate(sql) if query.startswith('SELECT "core_appointment"."time_slot_id"'))
+        self.assertLess(savepoint, previous)
+        self.assertEqual(self.booked(), 0)
+
+    def test_admin_actions_keep_counter_in_sync(self):
+        self.book(9)
+        self.book(10)
+        admin = AppointmentAdmin(Appointment, None)
+        admin.message_user = lambda request, message: None
+
+        admin.cancel_appointments(None, Appointment.objects.all())
+        self.assertEqual(self.booked(), 0)
+        admin.confirm_appointments(None, Appointment.objects.filter(appointment_time=time(9)))
+        self.assertEqual(self.booked(), 1)
+        admin.mark_completed(None, Appointment.objects.all())
+        self.assertEqual(self.booked(), 0)
+
+    def test_capacity_check_is_a_single_lookup(self):
+        self.book(9)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.slot.get_available_slots(self.saturday), 2)
+
+    def test_reconcile_command_repairs_drift(self):
+        self.book(9)
+        self.book(10)
+        SlotOccupancy.objects.update(booked=7)
+        out = StringIO()
+        call_command('reconcile_slot_occupancy', '--dry-run', stdout=out)
+        self.assertIn('stored=7 expected=2', out.getvalue())
+        self.assertEqual(self.booked(), 7)
+
+        call_command('reconcile_slot_occupancy', stdout=StringIO())
+        self.assertEqual(self.booked(), 2)
+
+
+@override_settings(API_CACHE={**settings.API_CACHE, 'ENABLED': False})
+class QueryCountTests(TestCase):
+    """Every ViewSet endpoint must run a constant number of queries, however many rows it returns."""
+    client_class = APIClient
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.staff = CustomUser.objects.create_user(username='staff', password='x', is_staff=True)
+        self.doctors = []
+        self.grow(2)
+        self.doctor = self.doctors[0]
+
+    def grow(self, count):
+        for _ in range(count):
+            doctor = make_doctor(f'doctor{len(self.doctors)}')
+            make_slot(doctor, max_patients=3)
+            make_review(doctor, self.patient, 4)
+            book_appointment(self.patient, doctor, next_weekday(0), time(10))
+            self.doctors.append(doctor)
+
+    def endpoints(self):
+        return [
+            ('doctor list', '/api/doctors/', None),
+            ('doctor detail', f'/api/doctors/{self.doctor.id}/', None),
+            ('doctor time slots', f'/api/doctors/{self.doctor.id}/time_slot/', self.patient),
+            ('timeslot list', '/api/timeslots/', None),
+            ('appointments as patient', '/api/appointments/', self.patient),
+            ('appointments as doctor', '/api/appointments/', self.doctor.user),
+            ('appointments as staff', '/api/appointments/', self.staff),
+            ('appointment detail', f'/api/appointments/{Appointment.objects.first().id}/', self.staff),
+            ('review list', ReviewViewSet.as_view({'get': 'list'}), self.patient),
+            ('review list as staff', ReviewViewSet.as_view({'get': 'list'}), self.staff),
+            ('doctor reviews', f'/api/doctors/{self.doctor.id}/reviews/', None),
+        ]
+
+    def count_queries(self):
+        counts = {}
+        for name, target, user in self.endpoints():
+            # A fresh user per request, as the authentication layer would load it.
+            user = user and CustomUser.objects.get(pk=user.pk)
+            self.client.force_authenticate(user)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(target, user)
+            self.assertEqual(response.status_code, 200, f'{name}: {response.rendered_content[:200]}')
+            counts[name] = len(queries)
+        return counts
+
+    def get(self, target, user):
+        if isinstance(target, str):
+            return self.client.get(target)
+        # Views that are not routed are called directly.
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user)
+        return target(request)
+
+    def test_review_viewset_is_not_routed(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get('/api/reviews/').status_code, 404)
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        before = self.count_queries()
+        self.grow(5)
+        after = self.count_queries()
+        for name, count in before.items():
+            with self.subTest(name):
+                self.assertEqual(after[name], count)
+                self.assertLessEqual(count, 3)
+
+
+class PaginationTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        make_slot(self.doctor, max_patients=20)
+        self.patient = make_patient()
+        saturday = next_weekday(0)
+        for week in range(3):
+            for hour, minute in ((11, 0), (9, 0), (9, 30), (10, 0)):
+                book_appointment(self.patient, self.doctor, saturday + timedelta(weeks=week), time(hour, minute))
+
+    def walk(self, url, params):
+        rows, pages = [], 0
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            rows += body.get('results', body.get('reviews'))
+            url, params, pages = body['next'], None, pages + 1
+        return rows, pages
+
+    def test_appointments_use_keyset_order(self):
+        self.client.force_authenticate(self.patient)
+        rows, pages = self.walk('/api/appointments/', {'page_size': 5})
+        expected = list(Appointment.objects.order_by('-appointment_date', 'appointment_time', 'id')
+                        .values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+        self.assertEqual(pages, 3)
+
+    def test_page_size_is_capped(self):
+        for i in range(5):
+            make_doctor(f'doctor{i}')
+        body = self.client.get('/api/doctors/', {'page_size': 2}).json()
+        self.assertEqual((body['count'], len(body['results'])), (6, 2))
+        with mock.patch.object(StandardPagination, 'max_page_size', 4):
+            body = self.client.get('/api/doctors/', {'page_size': 10 ** 6}).json()
+        self.assertEqual(len(body['results']), 4)
+
+    def test_doctor_reviews_are_paginated(self):
+        for rating in (5, 4, 3):
+            make_review(self.doctor, self.patient, rating)
+        rows, pages = self.walk(f'/api/doctors/{self.doctor.id}/reviews/', {'page_size': 2})
+        self.assertEqual([row['rating'] for row in rows], [3, 4, 5])
+        self.assertEqual(pages, 2)
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(self.patient)
+        for values in ('garbage', [1, 2], ['not a date', '09:00', 1], None):
+            cursor = values if isinstance(values, str) else urlsafe_b64encode(json.dumps(values).encode()).decode()
+            self.assertEqual(self.client.get('/api/appointments/', {'cursor': cursor}).status_code, 404, values)
+
+
+class ResponseCacheTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.review = make_review(self.doctor, self.patient, 5, is_approved=False)
+        self.urls = [
+            '/api/doctors/',
+            f'/api/doctors/{self.doctor.id}/',
+            f'/api/doctors/{self.doctor.id}/reviews/',
+            f'/api/doctors/{self.doctor.id}/rating-stats/',
+        ]
+
+    def assertCached(self, url):
+        # Only the conditional GET validators, read from the database while the cache is per process.
+        with self.assertNumQueries(1):
+            return self.client.get(url).json()
+
+    def test_second_read_is_served_from_cache(self):
+        before = cache_stats()
+        for url in self.urls:
+            self.client.get(url)
+            self.assertCached(url)
+        after = cache_stats()
+        self.assertEqual(after['hits'] - before['hits'], len(self.urls))
+        self.assertEqual(after['misses'] - before['misses'], len(self.urls))
+
+    def test_review_approval_invalidates_doctor_endpoints(self):
+        for url in self.urls:
+            self.client.get(url)
+        self.review.is_approved = True
+        self.review.save()
+        stats = self.client.get(f'/api/doctors/{self.doctor.id}/rating-stats/').json()
+        self.assertEqual(stats['stats']['total_reviews'], 1)
+        self.assertEqual(self.client.get('/api/doctors/').json()['results'][0]['total_reviews'], 1)
+
+    def test_profile_name_change_invalidates_doctor(self):
+        url = f'/api/doctors/{self.doctor.id}/'
+        self.client.get(url)
+        self.client.force_authenticate(self.doctor.user)
+        self.client.put('/api/profile/', {'first_name': 'Reza'})
+        self.assertEqual(self.client.get(url).json()['user']['first_name'], 'Reza')
+
+    def test_timeslot_change_invalidates_time_slots(self):
+        self.client.force_authenticate(self.patient)
+        url = f'/api/doctors/{self.doctor.id}/time_slot/'
+        self.assertEqual(len(self.client.get(url).json()), 1)
+        make_slot(self.doctor, day_of_week=2)
+        self.assertEqual(len(self.client.get(url).json()), 2)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_links_follow_the_requested_host(self):
+        for i in range(3):
+            make_doctor(f'doctor{i}')
+        self.client.get('/api/doctors/', {'page_size': 2})
+        body = self.client.get('/api/doctors/', {'page_size': 2}, HTTP_HOST='api.example.com').json()
+        self.assertTrue(body['next'].startswith('http://api.example.com/'))
+
+    def test_saves_of_uncached_user_fields_skip_invalidation(self):
+        user = CustomUser.objects.get(pk=self.patient.pk)
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+        with self.assertNumQueries(1):
+            user.save()
+        user.first_name = 'Sara'
+        with self.assertNumQueries(3):
+            user.save()
+
+    def test_other_doctors_stay_cached(self):
+        other = make_doctor('other')
+        url = f'/api/doctors/{other.id}/'
+        self.client.get(url)
+        make_slot(self.doctor, day_of_week=2)
+        self.assertCached(url)
+
+
+# The tests run in one process, so the local memory cache stands in for a shared one.
+@mock.patch('core.cache.LOCAL_BACKENDS', ())
+class ConditionalGetTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.slot = make_slot(self.doctor, max_patients=3)
+
+    def test_doctor_endpoints_answer_304_without_queries(self):
+        self.client.force_authenticate(self.patient)
+        for url in ('/api/doctors/', f'/api/doctors/{self.doctor.id}/', f'/api/doctors/{self.doctor.id}/time_slot/',
+                    f'/api/doctors/{self.doctor.id}/reviews/', f'/api/doctors/{self.doctor.id}/rating-stats/'):
+            with self.subTest(url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_the_data(self):
+        url = f'/api/doctors/{self.doctor.id}/'
+        etag = self.client.get(url)['ETag']
+        self.doctor.fee = 250
+        self.doctor.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_per_process_cache_validates_against_the_database(self):
+        url = f'/api/doctors/{self.doctor.id}/time_slot/'
+        self.client.force_authenticate(self.patient)
+        with mock.patch('core.cache.LOCAL_BACKENDS', (LocMemCache,)):
+            etag = self.client.get(url)['ETag']
+            # Another worker, with its own empty cache, agrees on the validators.
+            caches['default'].clear()
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+            make_slot(self.doctor, day_of_week=1)
+            caches['default'].clear()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+        self.assertIn('Last-Modified', response)
+
+    def test_appointment_etag_follows_nested_names(self):
+        book_appointment(self.patient, self.doctor, next_weekday(0), time(9))
+        self.client.force_authenticate(self.patient)
+        etag = self.client.get('/api/appointments/')['ETag']
+        self.doctor.user.first_name = 'Reza'
+        self.doctor.user.save()
+        response = self.client.get('/api/appointments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['doctor']['user']['first_name'], 'Reza')
+
+    def test_appointment_list_revalidates_with_one_query(self):
+        appointment = book_appointment(self.patient, self.doctor, next_weekday(0), time(9))
+        self.client.force_authenticate(self.patient)
+        response = self.client.get('/api/appointments/')
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/appointments/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        response = self.client.get('/api/appointments/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        appointment.cancel()
+        self.assertEqual(self.client.get('/api/appointments/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class DefaultCacheConditionalGetTests(TestCase):
+    """The doctor endpoints with the shipped, per-process cache configuration."""
+    client_class = APIClient
+
+    def setUp(self):
+        if versions_are_shared():
+            self.skipTest('the configured cache is shared')
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        make_slot(self.doctor)
+        make_review(self.doctor, self.patient, 4)
+        self.token = AuthToken.objects.issue(self.patient).key
+
+    def test_doctor_endpoints_send_validators(self):
+        headers = {'Authorization': f'Token {self.token}'}
+        for path in ('doctors/', f'doctors/{self.doctor.id}/', f'doctors/{self.doctor.id}/time_slot/',
+                     f'doctors/{self.doctor.id}/reviews/', f'doctors/{self.doctor.id}/rating-stats/'):
+            for prefix, get in (('/api/', self.client.get), ('/api/async/', async_to_sync(self.async_client.get))):
+                with self.subTest(path=prefix + path):
+                    response = get(prefix + path, headers=headers)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertIn('Last-Modified', response)
+                    response = get(prefix + path, headers={**headers, 'If-None-Match': response['ETag']})
+                    self.assertEqual(response.status_code, 304)
+
+    def test_review_approval_changes_the_etag(self):
+        url = f'/api/doctors/{self.doctor.id}/rating-stats/'
+        etag = self.client.get(url)['ETag']
+        set_reviews_approval(Review.objects.all(), False)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stats']['total_reviews'], 0)
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        self.key = self.client.post('/api/login/', {'username': 'patient', 'password': 'x'}).json()['token']
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {self.key}'}
+
+    def test_repeated_requests_skip_the_token_query(self):
+        self.assertEqual(self.client.get('/api/profile/', **self.auth).status_code, 200)
+        before = token_cache.stats()
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/profile/', **self.auth)
+        self.assertEqual(response.json()['username'], 'patient')
+        self.assertEqual(token_cache.stats()['shared_hits'], before['shared_hits'] + 1)
+
+    def test_local_level_is_opt_in(self):
+        with self.settings(AUTH_TOKEN_CACHE={**settings.AUTH_TOKEN_CACHE, 'LOCAL_TTL': 10}):
+            self.client.get('/api/profile/', **self.auth)
+            before = token_cache.stats()
+            self.client.get('/api/profile/', **self.auth)
+            self.assertEqual(token_cache.stats()['local_hits'], before['local_hits'] + 1)
+        token_cache.clear()
+
+    def test_revocation_in_another_process_applies_immediately(self):
+        self.client.get('/api/profile/', **self.auth)
+        # Another worker deactivates the user: it clears the shared level, not this process's.
+        CustomUser.objects.filter(pk=self.patient.pk).update(is_active=False)
+        token_cache.shared().delete(token_cache.shared_key(self.key))
+        self.assertEqual(self.client.get('/api/profile/', **self.auth).status_code, 401)
+
+    def test_shared_level_serves_other_processes(self):
+        self.client.get('/api/profile/', **self.auth)
+        token_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/profile/', **self.auth).status_code, 200)
+
+    def test_logout_invalidates_immediately(self):
+        self.client.get('/api/profile/', **self.auth)
+        self.assertEqual(self.client.post('/api/logout/', **self.auth).status_code, 200)
+        self.assertEqual(self.client.get('/api/profile/', **self.auth).status_code, 401)
+
+    def test_deactivation_invalidates_immediately(self):
+        self.client.get('/api/profile/', **self.auth)
+        self.patient.is_active = False
+        self.patient.save()
+        self.assertEqual(self.client.get('/api/profile/', **self.auth).status_code, 401)
+
+    def test_cache_can_be_disabled(self):
+        self.client.get('/api/profile/', **self.auth)
+        with self.settings(AUTH_TOKEN_CACHE={**settings.AUTH_TOKEN_CACHE, 'ENABLED': False}):
+            with self.assertNumQueries(1):
+                self.client.get('/api/profile/', **self.auth)
+
+
+class ExpiringTokenTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+
+    def login(self):
+        return self.client.post('/api/login/', {'username': 'patient', 'password': 'x'}).json()['token']
+
+    def test_login_reuses_a_valid_token(self):
+        self.assertEqual(self.login(), self.login())
+        self.assertEqual(AuthToken.objects.count(), 1)
+
+        AuthToken.objects.update(expires_at=timezone.now())
+        self.assertNotEqual(self.login(), AuthToken.objects.order_by('created').first().key)
+
+    def test_expired_token_is_rejected(self):
+        key = self.login()
+        auth = {'HTTP_AUTHORIZATION': f'Token {key}'}
+        self.assertEqual(self.client.get('/api/profile/', **auth).status_code, 200)
+        AuthToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        token_cache.invalidate(key)
+        self.assertEqual(self.client.get('/api/profile/', **auth).status_code, 401)
+
+    def test_last_used_is_written_at_most_once_per_interval(self):
+        key = self.login()
+        auth = {'HTTP_AUTHORIZATION': f'Token {key}'}
+        stale = timezone.now() - timedelta(hours=1)
+        AuthToken.objects.update(last_used=stale, expires_at=stale + timedelta(days=1))
+        token_cache.invalidate(key)
+
+        self.client.get('/api/profile/', **auth)
+        token = AuthToken.objects.get()
+        self.assertGreater(token.last_used, stale)
+        self.assertGreater(token.expires_at, timezone.now() + timedelta(days=6))
+        with self.assertNumQueries(0):
+            self.client.get('/api/profile/', **auth)
+
+    def test_purge_command_deletes_expired_tokens_in_chunks(self):
+        self.login()
+        AuthToken.objects.bulk_create([
+            AuthToken(key=f'{i:040d}', user=self.patient, expires_at=timezone.now() - timedelta(days=1))
+            for i in range(5)
+        ])
+        out = StringIO()
+        call_command('purge_expired_tokens', '--chunk-size', '2', stdout=out)
+        self.assertIn('5 expired tokens purged', out.getvalue())
+        self.assertEqual(AuthToken.objects.count(), 1)
+
+
+class IntervalIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = IntervalIndex([(time(14), time(16), 'c'), (time(9), time(12), 'a'), (time(10), time(11), 'b')])
+
+    def test_overlap_queries(self):
+        self.assertEqual(self.index.conflict(time(11, 30), time(13))[2], 'a')
+        self.assertIsNone(self.index.conflict(time(12), time(14)))
+        self.assertEqual([item[2] for item in self.index.overlapping(time(10, 30), time(15))], ['a', 'b', 'c'])
+
+    def test_gap_queries(self):
+        self.assertIsNone(self.index.gap_at(time(10)))
+        self.assertEqual(self.index.gap_at(time(13)), (time(12), time(14)))
+        self.assertEqual(self.index.next_free(time(10)), (time(12), time(14)))
+        self.assertEqual(self.index.next_free(time(10), minutes=180)[0], time(16))
+        self.assertEqual(IntervalIndex().next_free(time(8)), (time(8), time.max))
+
+
+class BulkTimeSlotTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        make_slot(self.doctor, day_of_week=0, start=time(9), end=time(12))
+        self.client.force_authenticate(self.doctor.user)
+
+    def post(self, **data):
+        return self.client.post('/api/timeslots/bulk/', data, format='json')
+
+    def test_sweep_reports_conflicts_with_existing_and_earlier_candidates(self):
+        existing = [(1, 3, 'a'), (10, 12, 'b')]
+        candidates = [(11, 13, 0), (3, 5, 1), (4, 6, 2), (6, 10, 3), (0, 2, 4)]
+        self.assertEqual(sweep_conflicts(existing, candidates), {0: 'b', 2: 1, 4: 'a'})
+
+    def test_batch_is_all_or_nothing_by_default(self):
+        response = self.post(slots=[
+            {'day_of_week': 1, 'start_time': '09:00', 'end_time': '10:00'},
+            {'day_of_week': 0, 'start_time': '11:00', 'end_time': '13:00'},
+            {'day_of_week': 1, 'start_time': '09:30', 'end_time': '10:30'},
+            {'day_of_week': 2, 'start_time': '10:00', 'end_time': '09:00'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+        self.assertEqual(TimeSlot.objects.count(), 1)
+
+    def test_partial_batch_creates_the_valid_slots(self):
+        response = self.post(partial=True, slots=[
+            {'day_of_week': 1, 'start_time': '09:00', 'end_time': '10:00'},
+            {'day_of_week': 0, 'start_time': '11:00', 'end_time': '13:00'},
+        ])
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertEqual(TimeSlot.objects.count(), 2)
+
+    def test_rule_expands_into_slots(self):
+        response = self.post(rule={'days': [1, 2], 'start_time': '14:00', 'end_time': '16:00', 'slot_minutes': 45})
+        self.assertEqual(response.status_code, 201, response.content)
+        ends = sorted(str(slot.end_time) for slot in TimeSlot.objects.filter(day_of_week=1))
+        self.assertEqual(ends, ['14:45:00', '15:30:00', '16:00:00'])
+        self.assertEqual(TimeSlot.objects.filter(day_of_week=2).count(), 3)
+
+    def test_clean_rejects_overlapping_slot(self):
+        with self.assertRaisesMessage(ValidationError, 'تداخل'), self.assertNumQueries(1):
+            TimeSlot(doctor=self.doctor, day_of_week=0, start_time=time(11), end_time=time(13)).clean()
+        TimeSlot(doctor=self.doctor, day_of_week=0, start_time=time(12), end_time=time(13)).clean()
+
+    def test_only_the_doctor_or_staff_can_bulk_create(self):
+        other = make_doctor('other')
+        response = self.post(doctor=other.id, slots=[{'day_of_week': 1, 'start_time': '09:00', 'end_time': '10:00'}])
+        self.assertEqual(response.status_code, 403)
+        self.client.force_authenticate(make_patient())
+        response = self.post(slots=[{'day_of_week': 1, 'start_time': '09:00', 'end_time': '10:00'}])
+        self.assertEqual(response.status_code, 400)
+
+
+class BenchmarkTests(TestCase):
+    def test_suite_runs_on_a_small_dataset(self):
+        factory = DatasetFactory(doctors=3, patients=5, appointments=20, reviews=10)
+        report = run_benchmarks(factory, iterations=3)
+        self.assertEqual(Review.objects.count(), 10)
+        self.assertEqual(report['meta']['dataset']['appointments'], 20)
+        for name, result in report['results'].items():
+            with self.subTest(name):
+                self.assertTrue(all(200 <= status < 300 for status in result['statuses']), result)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class QueryInstrumentationTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        make_slot(self.doctor)
+
+    def config(self, **overrides):
+        return override_settings(QUERY_INSTRUMENTATION={**settings.QUERY_INSTRUMENTATION, **overrides})
+
+    def test_server_timing_reports_query_count(self):
+        with self.config(SAMPLE_RATE=1.0), override_settings(API_CACHE={**settings.API_CACHE, 'ENABLED': False}):
+            response = self.client.get('/api/doctors/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="3 queries", app;dur=[\d.]+$')
+
+    def test_unsampled_requests_are_not_instrumented(self):
+        with self.config(SAMPLE_RATE=0.0):
+            self.assertNotIn('Server-Timing', self.client.get('/api/doctors/'))
+
+    def test_repeated_statements_are_logged(self):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            for doctor_id in range(3):
+                list(TimeSlot.objects.filter(doctor_id=doctor_id))
+            list(TimeSlot.objects.filter(doctor_id__in=[1, 2]))
+            list(TimeSlot.objects.filter(doctor_id__in=[1, 2, 3]))
+        self.assertEqual(stats.count, 5)
+        self.assertEqual([count for _, count in stats.duplicates(2)], [3, 2])
+
+        with self.config(SLOW_QUERIES=1), self.assertLogs('core.queries', 'WARNING') as logs:
+            self.client.get(f'/api/doctors/{self.doctor.id}/reviews/')
+        self.assertEqual(logs.records[0].query_stats['path'], f'/api/doctors/{self.doctor.id}/reviews/')
+
+
+class LoggingTests(TestCase):
+    def test_redact_masks_sensitive_fields(self):
+        data = {'username': 'ali', 'password': 'secret', 'profile': [{'national_code': '123', 'phone': '0912'}]}
+        self.assertEqual(redact(data), {'username': 'ali', 'password': '***',
+                                        'profile': [{'national_code': '***', 'phone': '0912'}]})
+
+    def test_queued_handler_writes_json_off_thread(self):
+        stream = StringIO()
+        handler = QueuedJsonHandler(stream)
+        logger = logging.getLogger('queued.json.test')
+        logger.addHandler(handler)
+        logger.propagate = False
+        token = request_id.set('abc123')
+        try:
+            logger.warning('hello %s', 'world', extra={'data': {'password': 'x', 'username': 'ali'}})
+        finally:
+            request_id.reset(token)
+            logger.removeHandler(handler)
+            handler.stop_listener()
+        entry = json.loads(stream.getvalue())
+        self.assertEqual((entry['message'], entry['request_id'], entry['level']), ('hello world', 'abc123', 'WARNING'))
+        self.assertEqual(entry['data'], {'password': '***', 'username': 'ali'})
+        self.assertNotEqual(handler.listener_pid, os.getpid())
+
+    def test_request_id_is_echoed_or_generated(self):
+        self.assertEqual(self.client.get('/api/doctors/', HTTP_X_REQUEST_ID='req-1')['X-Request-ID'], 'req-1')
+        generated = self.client.get('/api/doctors/', HTTP_X_REQUEST_ID='bad id!')['X-Request-ID']
+        self.assertRegex(generated, r'^[0-9a-f]{32}$')
+
+    def test_registration_logs_are_redacted(self):
+        with self.settings(REQUEST_LOGGING={**settings.REQUEST_LOGGING, 'ENABLED': True}), \
+                self.assertLogs('core', 'INFO') as logs:
+            self.client.post('/api/register/', {'username': 'new', 'password': 'p@ss', 'email': 'a@b.c',
+                                                'user_type': 'patient'})
+        attempt, access = logs.records
+        self.assertEqual(attempt.data['password'], '***')
+        self.assertEqual((access.path, access.status), ('/api/register/', 201))
+        self.assertNotIn('p@ss', '\n'.join(logs.output))
+
+
+class RegistrationTests(TestCase):
+    doctor_payload = {'username': 'dr', 'password': 'x', 'email': 'dr@x.com', 'user_type': 'doctor',
+                      'specialization': 'dentist', 'phone': '0912', 'address': 'Tehran', 'experience': '3', 'fee': '150'}
+
+    def test_doctor_registration_reuses_created_objects(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/register/', self.doctor_payload)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['doctor_info']['specialization'], 'دندانپزشک')
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'core_doctor' in q['sql']])
+
+    def test_failed_registration_leaves_no_user(self):
+        with mock.patch('core.registration.Doctor.objects.create', side_effect=ValueError('boom')):
+            response = self.client.post('/api/register/', self.doctor_payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CustomUser.objects.exists())
+
+    def test_import_patients_in_batches(self):
+        make_patient('taken')
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'patients.csv')
+        with open(path, 'w', newline='') as f:
+            f.write('username,email,password,date_of_birth\n')
+            f.write('p1,p1@x.com,secret,1990-01-02\np2,,,\ntaken,,,\np3,,,not-a-date\np4,,,\n')
+        out, err = StringIO(), StringIO()
+        with self.assertNumQueries(4):
+            call_command('import_patients', path, '--batch-size', '3', stdout=out, stderr=err)
+        self.assertIn('3 patients imported, 2 rows skipped', out.getvalue())
+        self.assertIn('line 4', err.getvalue())
+        p1 = CustomUser.objects.get(username='p1')
+        self.assertTrue(p1.check_password('secret'))
+        self.assertFalse(CustomUser.objects.get(username='p2').has_usable_password())
+
+
+class AppointmentExportTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.staff = CustomUser.objects.create_user(username='staff', password='x', is_staff=True)
+        self.doctor = make_doctor()
+        self.other = make_doctor('other')
+        self.day = next_weekday(0)
+        make_slot(self.doctor, max_patients=3)
+        make_slot(self.other)
+        self.first = book_appointment(self.patient, self.doctor, self.day, time(9))
+        self.second = book_appointment(self.patient, self.doctor, self.day + timedelta(weeks=1), time(10))
+        self.third = book_appointment(self.patient, self.other, self.day, time(9))
+        Appointment.objects.filter(pk=self.second.pk).update(status='cancelled', symptoms='private')
+        self.client.force_authenticate(self.staff)
+
+    def export(self, **params):
+        response = self.client.get('/api/appointments/export/', params)
+        self.assertEqual(response.status_code, 200, response.content if not response.streaming else '')
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_streams_every_appointment_in_id_order(self):
+        with self.assertNumQueries(1):
+            lines = self.export().splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'appointment_date', 'appointment_time', 'status'])
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]],
+                         [self.first.id, self.second.id, self.third.id])
+        self.assertNotIn('private', '\n'.join(lines))
+
+    def test_jsonl_with_filters(self):
+        lines = self.export(output='jsonl', doctor=self.doctor.id, status='pending,confirmed',
+                            **{'from': self.day.isoformat(), 'to': self.day.isoformat()}).splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['id'], self.first.id)
+        self.assertEqual(row['appointment_date'], self.day.isoformat())
+        self.assertEqual(row['doctor_last_name'], 'doctor')
+
+        lines = self.export(output='jsonl', status=['cancelled']).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.second.id])
+
+    def test_csv_escapes_formulas(self):
+        self.patient.first_name = '=HYPERLINK("http://example.com")'
+        self.patient.last_name = '-2+3'
+        self.patient.save()
+        rows = list(csv.DictReader(StringIO(self.export())))
+        self.assertEqual(rows[0]['patient_first_name'], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(rows[0]['patient_last_name'], "'-2+3")
+        self.assertEqual(rows[0]['doctor_last_name'], 'doctor')
+
+    def test_doctor_zero_is_a_filter(self):
+        self.assertEqual(self.export(doctor=0).splitlines()[1:], [])
+
+    def test_streams_asynchronously_under_asgi(self):
+        token = AuthToken.objects.issue(self.staff).key
+
+        async def export():
+            response = await self.async_client.get('/api/appointments/export/', {'output': 'jsonl'},
+                                                   headers={'Authorization': f'Token {token}'})
+            self.assertTrue(response.is_async)
+            return [json.loads(line) async for line in response.streaming_content]
+
+        rows = async_to_sync(export)()
+        self.assertEqual([row['id'] for row in rows], [self.first.id, self.second.id, self.third.id])
+
+        async def chunked():
+            return [json.loads(line) async for line in aexport_lines(jsonl_lines, {}, chunk_size=1)]
+
+        with self.assertNumQueries(1):
+            self.assertEqual(async_to_sync(chunked)(), rows)
+
+    def test_invalid_parameters(self):
+        for params in ({'output': 'xml'}, {'status': 'lost'}, {'doctor': 'x'}, {'from': '2024-13-01'},
+                       {'from': '2024-02-02', 'to': '2024-02-01'}):
+            response = self.client.get('/api/appointments/export/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get('/api/appointments/export/').status_code, 403)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_appointments', '--format', 'jsonl', '--status', 'cancelled', '--chunk-size', '1',
+                     stdout=out)
+        self.assertEqual([json.loads(line)['id'] for line in out.getvalue().splitlines()], [self.second.id])
+
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'appointments.csv')
+        out = StringIO()
+        call_command('export_appointments', '--doctor', str(self.doctor.id), '--output', path, stdout=out)
+        self.assertIn('2 appointments exported', out.getvalue())
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import DoctorViewSet, TimeSlotViewSet, AppointmentViewSet, RegisterView, LoginView, LogoutView, ProfileView, \
-    DoctorReviewsView, DoctorRatingStatsView
+    DoctorReviewsView, DoctorRatingStatsView, CacheStatsView
 
 router = DefaultRouter()
 router.register('doctors', DoctorViewSet)
@@ -16,4 +17,15 @@ urlpatterns = [
     path('api/profile/', ProfileView.as_view(), name='profile'),
     path('api/doctors/<int:doctor_id>/reviews/', DoctorReviewsView.as_view(), name='doctor-reviews'),
     path('api/doctors/<int:doctor_id>/rating-stats/', DoctorRatingStatsView.as_view(), name='doctor-rating-stats'),
+    path('api/cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
+
+    # Async read endpoints, see core/async_views.py.
+    path('api/async/doctors/', async_views.doctor_list, name='async-doctor-list'),
+    path('api/async/doctors/<int:pk>/', async_views.doctor_detail, name='async-doctor-detail'),
+    path('api/async/doctors/<int:pk>/time_slot/', async_views.doctor_time_slot, name='async-doctor-time-slot'),
+    path('api/async/doctors/<int:pk>/availability/', async_views.doctor_availability,
+         name='async-doctor-availability'),
+    path('api/async/doctors/<int:doctor_id>/reviews/', async_views.doctor_reviews, name='async-doctor-reviews'),
+    path('api/async/doctors/<int:doctor_id>/rating-stats/', async_views.doctor_rating_stats,
+         name='async-doctor-rating-stats'),
 ]
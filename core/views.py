@@ -1,43 +1,146 @@
+import logging
+from decimal import Decimal, InvalidOperation
+
 from django.contrib.auth import authenticate
-from django.db.models import Count, Q
-from rest_framework.authtoken.models import Token
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from .authentication import token_cache
+from .availability import SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, SEARCH_MAX_RANGE_DAYS, doctor_availability, \
+    parse_date_range, parse_time_window, search_availability
+from .cache import cache_response, cache_stats
+from .conditional import conditional, doctor_validators, queryset_validators
+from .export import FORMATS, aexport_lines, export_rows, parse_filters
+from .log import redact
+from .pagination import AppointmentPagination, ReviewPagination
 from .permissions import IsOwnerOrReadOnly
+from .ratings import rating_stats
+from .registration import register_user
+from .scheduling import create_time_slots
 from .serializers import *
 
+logger = logging.getLogger(__name__)
+
 
 class DoctorViewSet(viewsets.ModelViewSet):
-    queryset = Doctor.objects.all()
-    serializer_class = DoctorSerializer
+    queryset = Doctor.objects.select_related('user', 'rating_summary').order_by('id')
+    serializer_class = DoctorWithRatingSerializer
 
     def get_permissions(self):
-        if self.action == 'list' or self.action == 'retrieve':
+        if self.action in ['list', 'retrieve', 'availability', 'search']:
             permission_classes = [AllowAny]
         else:
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    @conditional(doctor_validators('doctors'))
+    @cache_response('doctors')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(doctor_validators('pk'))
+    @cache_response('pk')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=True, methods=['get'])
+    @conditional(doctor_validators('pk'))
+    @cache_response('pk')
     def time_slot(self, request, pk=None):
         doctor = self.get_object()
         time_slot = TimeSlot.objects.filter(doctor=doctor, is_available=True)
         ser = TimeSlotSerializer(time_slot, many=True)
         return Response(ser.data)
 
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        doctor = self.get_object()
+        try:
+            date_from, date_to = parse_date_range(request.query_params)
+            time_from, time_to = parse_time_window(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'doctor': doctor.id,
+            'from': date_from,
+            'to': date_to,
+            'slots': doctor_availability(doctor, date_from, date_to, time_from, time_to)
+        })
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        params = request.query_params
+        try:
+            date_from, date_to = parse_date_range(params, max_days=SEARCH_MAX_RANGE_DAYS)
+            time_from, time_to = parse_time_window(params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            max_fee = Decimal(params['max_fee']) if params.get('max_fee') else None
+            after = int(params['cursor']) if params.get('cursor') else None
+            limit = min(int(params.get('limit', SEARCH_DEFAULT_LIMIT)), SEARCH_MAX_LIMIT)
+        except (ValueError, InvalidOperation):
+            return Response({'error': 'max_fee، cursor و limit باید عدد باشند'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit باید بزرگتر از صفر باشد'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results, next_cursor = search_availability(
+            date_from, date_to,
+            specialization=params.get('specialization'),
+            max_fee=max_fee,
+            time_from=time_from,
+            time_to=time_to,
+            after=after,
+            limit=limit,
+        )
+        return Response({
+            'from': date_from,
+            'to': date_to,
+            'next_cursor': next_cursor,
+            'results': [
+                {'doctor': DoctorWithRatingSerializer(doctor).data, 'earliest_slots': slots}
+                for doctor, slots in results
+            ]
+        })
+
 
 class TimeSlotViewSet(viewsets.ModelViewSet):
     queryset = TimeSlot.objects.all()
     serializer_class = TimeSlotSerializer
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        serializer = BulkTimeSlotSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user = request.user
+        doctor = serializer.validated_data.get('doctor') or getattr(user, 'doctor', None)
+        if doctor is None:
+            return Response({'error': 'دکتر مشخص نشده است'}, status=status.HTTP_400_BAD_REQUEST)
+        if not user.is_staff and doctor.user_id != user.pk:
+            raise PermissionDenied('فقط خود دکتر می‌تواند برنامه‌اش را تغییر دهد')
+
+        items, errors = serializer.items()
+        created, errors = create_time_slots(doctor, items, serializer.validated_data['partial'], errors)
+        errors = [{'index': index, 'error': error} for index, error in sorted(errors.items())]
+        if not created:
+            return Response({'created': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'created': TimeSlotSerializer(created, many=True).data,
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED)
+
 
 class AppointmentViewSet(viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = AppointmentPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -47,14 +150,38 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(patient=self.request.user)
 
+    @conditional(queryset_validators('patient', 'doctor', 'doctor__user'))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        output = request.query_params.get('output', 'csv')
+        if output not in FORMATS:
+            return Response({'error': 'فرمت خروجی باید csv یا jsonl باشد'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            filters = parse_filters(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        lines, content_type = FORMATS[output]
+        if isinstance(request._request, ASGIRequest):
+            content = aexport_lines(lines, filters)
+        else:
+            content = lines(export_rows(filters))
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="appointments.{output}"'
+        return response
+
     def get_queryset(self):
         user = self.request.user
+        appointments = Appointment.objects.select_related('patient', 'doctor__user')
         if user.is_staff:
-            return Appointment.objects.all()
+            return appointments
         elif hasattr(user, 'doctor'):
-            return Appointment.objects.filter(doctor=user.doctor)
+            return appointments.filter(doctor=user.doctor)
         else:
-            return Appointment.objects.filter(patient=user)
+            return appointments.filter(patient=user)
 
 
 class RegisterView(APIView):
@@ -82,10 +209,7 @@ class RegisterView(APIView):
         })
 
     def post(self, request):
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-
-        print("📨 داده‌های دریافتی:", request.data)
+        logger.info('Registration attempt', extra={'data': redact(request.data)})
 
         user_type = request.data.get('user_type', 'patient')
 
@@ -125,20 +249,17 @@ class RegisterView(APIView):
                     request.data['date_of_birth'], '%Y-%m-%d'
                 ).date()
 
-            user = User.objects.create_user(**user_data)
-
-            if user.user_type == 'doctor':
+            doctor_data = None
+            if user_type == 'doctor':
                 doctor_data = {
-                    'user': user,
                     'specialization': request.data['specialization'],
                     'phone': request.data['phone'],
                     'address': request.data['address'],
                     'experience': int(request.data['experience']),
-                    'fee': float(request.data['fee'])
+                    'fee': Decimal(str(request.data['fee']))
                 }
-                Doctor.objects.create(**doctor_data)
 
-            token, created = Token.objects.get_or_create(user=user)
+            user, doctor, token = register_user(user_data, doctor_data)
 
             response_data = {
                 'success': True,
@@ -155,8 +276,7 @@ class RegisterView(APIView):
                 'message': 'ثبت‌نام موفقیت‌آمیز بود'
             }
 
-            if user.user_type == 'doctor':
-                doctor = Doctor.objects.get(user=user)
+            if doctor:
                 response_data['doctor_info'] = {
                     'specialization': doctor.get_specialization_display(),
                     'experience': doctor.experience,
@@ -166,7 +286,7 @@ class RegisterView(APIView):
             return Response(response_data, status=status.HTTP_201_CREATED)
 
         except Exception as e:
-            print(f"❌ خطا: {str(e)}")
+            logger.warning('Registration failed', exc_info=True, extra={'username': request.data.get('username')})
             return Response({
                 'error': str(e),
                 'required_fields': required_fields.get(user_type)
@@ -183,7 +303,7 @@ class LoginView(APIView):
         user = authenticate(username=username, password=password)
 
         if user:
-            token, created = Token.objects.get_or_create(user=user)
+            token = AuthToken.objects.issue(user)
             return Response({
                 'token': token.key,
                 'user_id': user.id,
@@ -203,7 +323,7 @@ class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        request.user.auth_token.delete()
+        request.auth.delete()
         return Response({'message': 'exit is success'})
 
 
@@ -239,6 +359,7 @@ class ProfileView(APIView):
 
 class ReviewViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    pagination_class = ReviewPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -246,9 +367,10 @@ class ReviewViewSet(viewsets.ModelViewSet):
         return ReviewSerializer
 
     def get_queryset(self):
+        reviews = Review.objects.select_related('patient', 'doctor__user')
         if self.request.user.is_staff:
-            return Review.objects.all()
-        return Review.objects.filter(is_approved=True)
+            return reviews
+        return reviews.filter(is_approved=True)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -279,29 +401,21 @@ class ReviewViewSet(viewsets.ModelViewSet):
 class DoctorReviewsView(APIView):
     permission_classes = [AllowAny]
 
+    @conditional(doctor_validators('doctor_id'))
+    @cache_response('doctor_id')
     def get(self, request, doctor_id):
         try:
-            doctor = Doctor.objects.get(id=doctor_id)
-
-            reviews_stats = Review.objects.filter(
-                doctor=doctor,
-                is_approved=True
-            ).aggregate(
-                total_reviews=Count('id'),
-                average_rating=Avg('rating'),
-                five_star=Count('id', filter=Q(rating=5)),
-                four_star=Count('id', filter=Q(rating=4)),
-                three_star=Count('id', filter=Q(rating=3)),
-                two_star=Count('id', filter=Q(rating=2)),
-                one_star=Count('id', filter=Q(rating=1)),
-            )
+            doctor = Doctor.objects.select_related('user', 'rating_summary').get(id=doctor_id)
+            reviews_stats = rating_stats(doctor)
 
             reviews = Review.objects.filter(
                 doctor_id=doctor_id,
                 is_approved=True
-            ).order_by('-created_at')
+            ).select_related('patient', 'doctor__user')
 
-            serializer = ReviewSerializer(reviews, many=True)
+            paginator = ReviewPagination()
+            page = paginator.paginate_queryset(reviews, request, view=self)
+            serializer = ReviewSerializer(page, many=True)
 
             return Response({
                 'doctor': {
@@ -310,7 +424,8 @@ class DoctorReviewsView(APIView):
                     'specialization': doctor.get_specialization_display()
                 },
                 'stats': reviews_stats,
-                'reviews': serializer.data
+                'reviews': serializer.data,
+                'next': paginator.get_next_link()
             })
 
         except Doctor.DoesNotExist:
@@ -323,43 +438,18 @@ class DoctorReviewsView(APIView):
 class DoctorRatingStatsView(APIView):
     permission_classes = [AllowAny]
 
+    @conditional(doctor_validators('doctor_id'))
+    @cache_response('doctor_id')
     def get(self, request, doctor_id):
         try:
-            doctor = Doctor.objects.get(id=doctor_id)
-
-            stats = Review.objects.filter(
-                doctor=doctor,
-                is_approved=True
-            ).aggregate(
-                total_reviews=Count('id'),
-                average_rating=Avg('rating'),
-                rating_breakdown=Count('rating')
-            )
-
-            rating_details = []
-            for i in range(1, 6):
-                count = Review.objects.filter(
-                    doctor=doctor,
-                    rating=i,
-                    is_approved=True
-                ).count()
-                rating_details.append({
-                    'stars': i,
-                    'count': count,
-                    'percentage': round((count / stats['total_reviews']) * 100, 1) if stats['total_reviews'] > 0 else 0
-                })
-
+            doctor = Doctor.objects.select_related('user', 'rating_summary').get(id=doctor_id)
             return Response({
                 'doctor': {
                     'id': doctor.id,
                     'name': doctor.user.get_full_name(),
                     'specialization': doctor.get_specialization_display()
                 },
-                'stats': {
-                    'total_reviews': stats['total_reviews'],
-                    'average_rating': round(stats['average_rating'] or 0, 1),
-                    'rating_breakdown': rating_details
-                }
+                'stats': rating_stats(doctor)
             })
 
         except Doctor.DoesNotExist:
@@ -367,3 +457,13 @@ class DoctorRatingStatsView(APIView):
                 {'error': 'دکتر یافت نشد'},
                 status=status.HTTP_404_NOT_FOUND
             )
+
+
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'responses': cache_stats(),
+            'auth_tokens': token_cache.stats(),
+        })
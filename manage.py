@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Reserve.settings')
+    test_commands = {'test', 'benchmark', 'audit_indexes', 'bench_asgi'}
+    settings_module = 'Reserve.test_settings' if test_commands.intersection(sys.argv[1:2]) else 'Reserve.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: